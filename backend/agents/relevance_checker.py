@@ -1,47 +1,214 @@
 import json  # Import for JSON serialization
+import asyncio
 from langchain_openai import ChatOpenAI
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
-from llm.openai_llm import OPENAI_API_KEY
+from config.settings import settings
+from llm.openai_llm import get_chat_model
+from llm.rate_limiter import openai_rate_limiter, estimate_tokens
+from llm.token_budget import build_context
+from retriever.builder import VECTOR_SIMILARITY_KEY
 import logging
 
 logger = logging.getLogger(__name__)
 
+VALID_LABELS = {"CAN_ANSWER", "PARTIAL", "NO_MATCH"}
+
+# Fixed prompt text is built once at import; only the question/passages tail
+# is formatted per call. Kept short: it is billed as prompt tokens every time.
+_LABEL_DEFINITIONS = (
+    "**Labels:**\n"
+    "- CAN_ANSWER: the passages explicitly contain everything needed to fully answer the question.\n"
+    "- PARTIAL: the passages mention the question's topic or timeframe but lack some details.\n"
+    "- NO_MATCH: the passages do not mention the question's topic at all.\n"
+    "If the topic or timeframe is mentioned in any way, use PARTIAL rather than NO_MATCH.\n"
+)
+
+_RELEVANCE_PREAMBLE = (
+    "You are a relevance checker. Classify how well the passages address the question.\n"
+    + _LABEL_DEFINITIONS
+)
+_RELEVANCE_SUFFIX = "Respond ONLY with one of the following labels: CAN_ANSWER, PARTIAL, NO_MATCH\nAnswer: "
+
+# The label is read from the first token's log-probabilities, so a single
+# decode step is enough. Shortest accepted first token -> label.
+_LABEL_PREFIXES = (("CAN", "CAN_ANSWER"), ("PAR", "PARTIAL"), ("NO", "NO_MATCH"))
+
+
+def _label_for_token(token: str) -> Optional[str]:
+    """
+    Label a first token (or a whole reply) stands for: "CAN", "PART", "NO" or the
+    full label. The token must be a prefix of the label (or contain all of it),
+    so "NOT", "NONE" or "CANNOT" match nothing.
+    """
+    token = token.strip().strip(".:*\"'").upper()
+    for prefix, label in _LABEL_PREFIXES:
+        if token.startswith(prefix) and (label.startswith(token) or token.startswith(label)):
+            return label
+    return None
+
+_JOINT_PREAMBLE = (
+    "You are an assistant that checks whether the passages address the question, then answers it.\n"
+    + _LABEL_DEFINITIONS
+    + "For CAN_ANSWER or PARTIAL, answer using only the passages in a clear, factual paragraph under 80 tokens.\n"
+    "For NO_MATCH, leave the answer empty.\n"
+)
+_JOINT_SUFFIX = 'Respond ONLY as JSON: {"label": "...", "answer": "..."}'
+
+_BATCH_PREAMBLE = (
+    "You are a relevance checker. For every item, classify how well its passages (P) "
+    "address its question (Q), judging each item independently.\n"
+    + _LABEL_DEFINITIONS
+)
+_BATCH_SUFFIX = (
+    'Respond ONLY as JSON: {"labels": [{"id": 1, "label": "..."}, ...]} with one entry per item.'
+)
+
 
 class RelevanceChecker:
-    def __init__(self):
-        # Initialize the OpenAI Model llm
+    def __init__(self, model: Optional[ChatOpenAI] = None, joint_model: Optional[ChatOpenAI] = None):
+        # Initialize the OpenAI Model llm (shared HTTP pool unless injected)
         print("Initializing RelevanceChecker with OPEN AI...")
         
-        self.model = ChatOpenAI(
-            model="gpt-4.1-mini",
-            api_key=OPENAI_API_KEY,
-            max_tokens=10,
-            temperature=0,
-        )
+        self.model = model or get_chat_model(max_tokens=1, temperature=0, top_logprobs=5)
+
+        # Same model in JSON mode, with room for the draft answer, used by
+        # classify_and_answer() to label and answer in one round-trip
+        self.joint_model = joint_model or get_chat_model(max_tokens=120, temperature=0, json_mode=True)
 
     def generate_prompt(self, question: str, document_content: str) -> str:
         """
-        Generate a structured prompt for the LLM to generate a precise and factual answer.
-        """
-        # Create a prompt for the LLM to classify relevance
-        prompt = f"""
-        You are an AI relevance checker between a user's question and provided document content.
-        **Instructions:**
-        - Classify how well the document content addresses the user's question.
-        - Respond with only one of the following labels: CAN_ANSWER, PARTIAL, NO_MATCH.
-        - Do not include any additional text or explanation.
-        **Labels:**
-        1) "CAN_ANSWER": The passages contain enough explicit information to fully answer the question.
-        2) "PARTIAL": The passages mention or discuss the question's topic but do not provide all the details needed for a complete answer.
-        3) "NO_MATCH": The passages do not discuss or mention the question's topic at all.
-        **Important:** If the passages mention or reference the topic or timeframe of the question in any way, even if incomplete, respond with "PARTIAL" instead of "NO_MATCH".
-        **Question:** {question}
-        **Passages:** {document_content}
-        **Respond ONLY with one of the following labels: CAN_ANSWER, PARTIAL, NO_MATCH**
-        """
-        return prompt
+        Generate the relevance-classification prompt; only the question/passages tail is built per call.
+        """
+        return f"{_RELEVANCE_PREAMBLE}**Question:** {question}\n**Passages:** {document_content}\n{_RELEVANCE_SUFFIX}"
+
+    def generate_joint_prompt(self, question: str, document_content: str) -> str:
+        """
+        Generate a prompt that classifies relevance and drafts the answer in the same call.
+        """
+        return f"{_JOINT_PREAMBLE}**Question:** {question}\n**Passages:** {document_content}\n{_JOINT_SUFFIX}"
+
+    def _parse_joint(self, response) -> Dict[str, Any]:
+        """
+        Parse the JSON label/answer pair; a NO_MATCH label discards the answer.
+        Unparseable output (e.g. JSON truncated by max_tokens after a long draft)
+        yields label None, so the caller falls back to the label-only check.
+        """
+        try:
+            data = json.loads(response.content or "{}")
+            label = str(data.get("label", "")).strip().upper()
+            answer = str(data.get("answer") or "").strip()
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.warning(f"Unexpected joint response, falling back to label-only check: {e}")
+            return {"label": None, "answer": None}
+
+        logger.debug(f"Checker response: {label}")
+
+        if label not in VALID_LABELS:
+            logger.debug("LLM did not respond with a valid label; falling back to label-only check.")
+            return {"label": None, "answer": None}
+
+        if label == "NO_MATCH" or not answer:
+            answer = None
+
+        return {"label": label, "answer": answer}
+
+    def classify_and_answer(self, question: str, context: str) -> Dict[str, Any]:
+        """
+        Classify relevance and draft the answer with a single LLM call.
+        Returns: {"label": "CAN_ANSWER" | "PARTIAL" | "NO_MATCH" | None, "answer": str | None}
+        where label None means the response could not be parsed.
+        """
+        prompt = self.generate_joint_prompt(question, context)
+        try:
+            response = self.joint_model.invoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            # Never turn an upstream failure (429, timeout) into a cacheable NO_MATCH
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to check relevance due to a model error.") from e
+
+        return self._parse_joint(response)
+
+    async def aclassify_and_answer(self, question: str, context: str) -> Dict[str, Any]:
+        """
+        Async variant of classify_and_answer().
+        """
+        prompt = self.generate_joint_prompt(question, context)
+        try:
+            await openai_rate_limiter.acquire(
+                estimate_tokens(prompt, self.joint_model.max_tokens or 0)
+            )
+            response = await self.joint_model.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to check relevance due to a model error.") from e
+
+        return self._parse_joint(response)
+
+    def _label_from_logprobs(self, response) -> Optional[str]:
+        """Pick the label whose first token has the highest log-probability."""
+        try:
+            candidates = response.response_metadata["logprobs"]["content"][0]["top_logprobs"]
+        except (AttributeError, KeyError, IndexError, TypeError):
+            return None
+
+        best, best_logprob = None, float("-inf")
+        for cand in candidates:
+            label = _label_for_token(str(cand.get("token", "")))
+            if label is not None and cand.get("logprob", float("-inf")) > best_logprob:
+                best, best_logprob = label, cand["logprob"]
+        return best
+
+    def _parse_label(self, response) -> str:
+        """Map the raw LLM response onto one of the three valid labels."""
+        label = self._label_from_logprobs(response)
+        if label is not None:
+            logger.debug(f"Checker response: {label}")
+            return label
+
+        # No logprobs (e.g. an injected model without them): parse the text,
+        # which under max_tokens=1 is just the first token ("CAN", "PART", ...)
+        try:
+            llm_response = (response.content or "").strip().upper()
+            logger.debug(f"LLM response: {llm_response}")
+
+        except (IndexError, KeyError) as e:
+            logger.error(f"Unexpected response structure: {e}")
+            return "NO_MATCH"
+
+        logger.debug(f"Checker response: {llm_response}")
+
+        # Validate the response
+        classification = _label_for_token(llm_response)
+        if classification is None:
+            logger.debug("LLM did not respond with a valid label. Forcing 'NO_MATCH'.")
+            classification = "NO_MATCH"
+        else:
+            logger.debug(f"Classification recognized as '{classification}'.")
+
+        return classification
+
+    def gate(self, documents: List[Document]) -> Optional[str]:
+        """
+        Cheap pre-check on the scores the retrieval already computed (no LLM call,
+        no extra search). Returns "NO_MATCH" when even the best vector hit is far
+        from the question, else None: positive labels always come from the LLM.
+        """
+        if not settings.RELEVANCE_GATE_ENABLED:
+            return None
+
+        scores = [
+            d.metadata[VECTOR_SIMILARITY_KEY] for d in documents if VECTOR_SIMILARITY_KEY in d.metadata
+        ]
+        if not scores:
+            return None
+
+        max_score = max(scores)
+        logger.debug(f"Relevance gate: max cosine similarity {max_score:.3f}")
+        if max_score < settings.RELEVANCE_NO_MATCH_THRESHOLD:
+            return "NO_MATCH"
+        return None
 
     def check(self, question: str, retriever, k=3) -> str:
         """
@@ -53,7 +220,7 @@ class RelevanceChecker:
         logger.debug(
             f"RelevanceChecker.check called with question='{question}' and k={k}"
         )
-        
+
         # Retrieve doc chunks from the ensemble retriever
         top_docs = retriever.invoke(question)
         
@@ -63,8 +230,24 @@ class RelevanceChecker:
             )
             return "NO_MATCH"
 
+        # A clear miss is decided from the retrieval's similarity scores alone
+        gated = self.gate(top_docs)
+        if gated is not None:
+            logger.debug(f"Relevance gate decided '{gated}'.")
+            return gated
+
+        return self.classify(question, top_docs, k=k)
+
+    def classify(self, question: str, top_docs: List[Document], k=3) -> str:
+        """
+        LLM classification of already-retrieved documents (no retrieval, no gate).
+        """
+        if not top_docs:
+            logger.debug("No documents to classify. Classifying as NO_MATCH.")
+            return "NO_MATCH"
+
         # Combine the top k chunk texts into one string
-        document_content = "\n\n".join(doc.page_content for doc in top_docs[:k])
+        document_content = build_context(top_docs, settings.RELEVANCE_MAX_CTX_TOKENS, k=k)
         
         # Create a prompt for the LLM
         prompt = self.generate_prompt(question, document_content)
@@ -74,26 +257,164 @@ class RelevanceChecker:
             response = self.model.invoke([HumanMessage(content=prompt)])
         except Exception as e:
             logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to check relevance due to a model error.") from e
+
+        return self._parse_label(response)
+
+    async def acheck(self, question: str, retriever, k=3) -> str:
+        """
+        Async variant of check(): same steps, but the retrieval and the LLM
+        round-trip are awaited so the event loop stays free meanwhile.
+        """
+        logger.debug(
+            f"RelevanceChecker.acheck called with question='{question}' and k={k}"
+        )
+
+        top_docs = await retriever.ainvoke(question)
+        gated = self.gate(top_docs) if top_docs else None
+        if gated is not None:
+            logger.debug(f"Relevance gate decided '{gated}'.")
+            return gated
+        return await self.aclassify(question, top_docs, k=k)
+
+    async def aclassify(self, question: str, top_docs: List[Document], k=3) -> str:
+        """
+        Async variant of classify().
+        """
+        if not top_docs:
+            logger.debug("No documents to classify. Classifying as NO_MATCH.")
             return "NO_MATCH"
 
-        # Extract the content from the response
+        document_content = build_context(top_docs, settings.RELEVANCE_MAX_CTX_TOKENS, k=k)
+        prompt = self.generate_prompt(question, document_content)
+
         try:
-            llm_response = (response.content or "").strip().upper()
-            logger.debug(f"LLM response: {llm_response}")
+            await openai_rate_limiter.acquire(
+                estimate_tokens(prompt, self.model.max_tokens or 0)
+            )
+            response = await self.model.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to check relevance due to a model error.") from e
 
-        except (IndexError, KeyError) as e:
-            logger.error(f"Unexpected response structure: {e}")
-            return "NO_MATCH"
+        return self._parse_label(response)
+
+    async def check_many(
+        self,
+        items: List[Tuple[str, Any]],
+        k=3,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+    ) -> List[str]:
+        """
+        Classify many (question, retriever) pairs concurrently.
+        Results are returned in the same order as `items`.
+        """
+        sem = asyncio.Semaphore(max_concurrency)
 
-        print(f"Checker response: {llm_response}")
+        async def _one(item: Tuple[str, Any]) -> str:
+            question, retriever = item
+            async with sem:
+                return await self.acheck(question, retriever, k=k)
 
-        # Validate the response
-        valid_labels = {"CAN_ANSWER", "PARTIAL", "NO_MATCH"}
-        if llm_response not in valid_labels:
-            logger.debug("LLM did not respond with a valid label. Forcing 'NO_MATCH'.")
-            classification = "NO_MATCH"
-        else:
-            logger.debug(f"Classification recognized as '{llm_response}'.")
-            classification = llm_response
+        return await asyncio.gather(*[_one(i) for i in items])
 
-        return classification
+    def generate_batch_prompt(self, questions: List[str], contents: List[str]) -> str:
+        """
+        Generate a single prompt that classifies several (question, passages) items at once.
+        """
+        items = "\n".join(
+            f"=== Item {i} ===\nQ={question}\nP={content}\n=== End Item {i} ==="
+            for i, (question, content) in enumerate(zip(questions, contents), start=1)
+        )
+        return f"{_BATCH_PREAMBLE}{items}\n{_BATCH_SUFFIX}"
+
+    def _parse_batch(self, response, n: int) -> List[Optional[str]]:
+        """
+        Parse the JSON label list. Items that are missing or invalid (e.g. JSON
+        truncated by max_tokens) are None: the caller re-checks them one by one.
+        """
+        labels: List[Optional[str]] = [None] * n
+        try:
+            entries = json.loads(response.content or "{}").get("labels", [])
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.warning(f"Unexpected batch response, falling back to per-item checks: {e}")
+            return labels
+
+        for entry in entries:
+            try:
+                idx = int(entry["id"]) - 1
+                label = str(entry["label"]).strip().upper()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= idx < n and label in VALID_LABELS:
+                labels[idx] = label
+        return labels
+
+    async def _classify_chunk(self, questions: List[str], contents: List[str]) -> List[Optional[str]]:
+        n = len(questions)
+        prompt = self.generate_batch_prompt(questions, contents)
+        # ~16 tokens per {"id": .., "label": ..} entry, plus the JSON wrapper
+        max_tokens = 16 * n + 10
+        try:
+            await openai_rate_limiter.acquire(estimate_tokens(prompt, max_tokens))
+            # JSON-mode model; the label-only model is capped at one token
+            response = await self.joint_model.ainvoke(
+                [HumanMessage(content=prompt)],
+                max_tokens=max_tokens,
+            )
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to check relevance due to a model error.") from e
+
+        return self._parse_batch(response, n)
+
+    async def classify_batch(
+        self,
+        questions: List[str],
+        documents: List[List[Document]],
+        k=3,
+        batch_size: int = settings.RELEVANCE_BATCH_SIZE,
+    ) -> List[str]:
+        """
+        Classify already-retrieved (question, documents) pairs, packing up to
+        `batch_size` items into each LLM call. Chunks are sent concurrently.
+        Results are returned in the same order as `questions`.
+        """
+        labels = ["NO_MATCH"] * len(questions)
+        # Questions without passages are NO_MATCH and never reach the LLM
+        pending = [i for i, docs in enumerate(documents) if docs]
+        contents = {
+            i: build_context(documents[i], settings.RELEVANCE_MAX_CTX_TOKENS, k=k) for i in pending
+        }
+
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        results = await asyncio.gather(
+            *[
+                self._classify_chunk([questions[i] for i in chunk], [contents[i] for i in chunk])
+                for chunk in chunks
+            ]
+        )
+        unlabeled = []
+        for chunk, chunk_labels in zip(chunks, results):
+            for i, label in zip(chunk, chunk_labels):
+                if label is None:
+                    unlabeled.append(i)
+                else:
+                    labels[i] = label
+
+        # Entries the batch reply dropped get the single-question check, never a guessed NO_MATCH
+        if unlabeled:
+            retried = await asyncio.gather(
+                *[self.aclassify(questions[i], documents[i], k=k) for i in unlabeled]
+            )
+            for i, label in zip(unlabeled, retried):
+                labels[i] = label
+        return labels
+
+    async def check_batch(self, questions: List[str], retriever, k=3) -> List[str]:
+        """
+        Retrieve passages per question, then classify them with as few LLM calls as possible.
+        Returns one of "CAN_ANSWER", "PARTIAL", "NO_MATCH" per question.
+        """
+        documents = await asyncio.gather(*[retriever.ainvoke(q) for q in questions])
+        return await self.classify_batch(questions, list(documents), k=k)
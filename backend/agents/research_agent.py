@@ -1,25 +1,34 @@
 
-from typing import Dict, List
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
 from config.settings import settings
 import json
-from llm.openai_llm import OPENAI_API_KEY
+from llm.openai_llm import get_chat_model
+from llm.rate_limiter import openai_rate_limiter, estimate_tokens
+from llm.token_budget import build_context
 from langchain_core.messages import HumanMessage
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fixed instructions built once; only the question/context tail is formatted per call
+_RESEARCH_PREAMBLE = (
+    "You are an AI assistant designed to provide precise and factual answers based on the given context.\n"
+    "**Instructions:**\n"
+    "- Answer the following question using only the provided context.\n"
+    "- Return a clear, concise, and factual short paragraph under 80 tokens.\n"
+)
+
 class ResearchAgent:
-    def __init__(self):
+    def __init__(self, model: Optional[ChatOpenAI] = None):
         """
-        Initialize the research agent with the IBM WatsonX ModelInference.
+        Initialize the research agent with an OpenAI chat model (shared HTTP pool unless injected).
         """
         # Initialize the OpenAI Model llm
         print("Initializing ResearchAgent with OPEN AI...")
-        self.model = ChatOpenAI(
-            model="gpt-4.1-mini",
-            api_key=OPENAI_API_KEY,
+        self.model = model or get_chat_model(
             max_tokens=80,   # Adjust based on desired response length
             temperature=0.2,   # Controls randomness; lower values make output more deterministic
         )
@@ -36,19 +45,7 @@ class ResearchAgent:
         """
         Generate a structured prompt for the LLM to generate a precise and factual answer.
         """
-        prompt = f"""
-        You are an AI assistant designed to provide precise and factual answers based on the given context.
-        **Instructions:**
-        - Answer the following question using only the provided context.
-        - Be clear, concise, and factual.
-        - Return a clear, concise, and factual short paragraph under 80 tokens from the context.
-        
-        **Question:** {question}
-        **Context:**
-        {context}
-        **Provide your answer below:**
-        """
-        return prompt
+        return f"{_RESEARCH_PREAMBLE}**Question:** {question}\n**Context:**\n{context}\n**Provide your answer below:**"
     
     def generate(self, question: str, documents: List[Document]) -> Dict:
         """
@@ -56,7 +53,7 @@ class ResearchAgent:
         """
         print(f"ResearchAgent.generate called with question='{question}' and {len(documents)} documents.")
         # Combine the top document contents into one string
-        context = "\n\n".join([doc.page_content for doc in documents])
+        context = build_context(documents, settings.RESEARCH_MAX_CTX_TOKENS)
         print(f"Combined context length: {len(context)} characters.")
         
         # Create a prompt for the LLM
@@ -73,19 +70,80 @@ class ResearchAgent:
             print(f"Error during model inference: {e}")
             raise RuntimeError("Failed to generate answer due to a model error.") from e
         
+        return self._finalize(response, context)
+
+    def _finalize(self, response, context: str) -> Dict:
+        """
+        Turn the raw LLM response into the draft answer payload.
+        """
         # Extract and process the LLM's response
         try:
             llm_response = (response.content or "").strip()
             logger.debug(f"LLM response: {llm_response}")
 
         except (IndexError, KeyError) as e:
-            print(f"Unexpected response structure: {e}")
+            logger.error(f"Unexpected response structure: {e}")
             llm_response = "I cannot answer this question based on the provided documents."
         
         # Sanitize the response
         draft_answer = self.sanitize_response(llm_response) if llm_response else "I cannot answer this question based on the provided documents."
-        print(f"Generated answer: {draft_answer}")
+        logger.debug(f"Generated answer ({len(draft_answer)} chars)")
         return {
             "draft_answer": draft_answer,
             "context_used": context
-        }
\ No newline at end of file
+        }
+
+    async def agenerate(self, question: str, documents: List[Document]) -> Dict:
+        """
+        Async variant of generate(): awaits the LLM instead of blocking the caller.
+        """
+        logger.debug(f"ResearchAgent.agenerate called with {len(documents)} documents.")
+        context = build_context(documents, settings.RESEARCH_MAX_CTX_TOKENS)
+        prompt = self.generate_prompt(question, context)
+
+        try:
+            await openai_rate_limiter.acquire(
+                estimate_tokens(prompt, self.model.max_tokens or 0)
+            )
+            response = await self.model.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to generate answer due to a model error.") from e
+
+        return self._finalize(response, context)
+
+    async def agenerate_stream(self, question: str, documents: List[Document]) -> AsyncIterator[str]:
+        """
+        Stream the answer token chunks as the model produces them.
+        """
+        context = build_context(documents, settings.RESEARCH_MAX_CTX_TOKENS)
+        prompt = self.generate_prompt(question, context)
+
+        try:
+            await openai_rate_limiter.acquire(
+                estimate_tokens(prompt, self.model.max_tokens or 0)
+            )
+            async for chunk in self.model.astream([HumanMessage(content=prompt)]):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to generate answer due to a model error.") from e
+
+    async def generate_many(
+        self,
+        items: List[Tuple[str, List[Document]]],
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+    ) -> List[Dict]:
+        """
+        Generate answers for many (question, documents) pairs concurrently.
+        Results are returned in the same order as `items`.
+        """
+        sem = asyncio.Semaphore(max_concurrency)
+
+        async def _one(item: Tuple[str, List[Document]]) -> Dict:
+            question, documents = item
+            async with sem:
+                return await self.agenerate(question, documents)
+
+        return await asyncio.gather(*[_one(i) for i in items])
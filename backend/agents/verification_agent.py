@@ -1,26 +1,25 @@
 import json  # Import for JSON serialization
 from langchain_openai import ChatOpenAI
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
-from llm.openai_llm import OPENAI_API_KEY
+from llm.openai_llm import get_chat_model
+from llm.rate_limiter import openai_rate_limiter, estimate_tokens
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class VerificationAgent:
-    def __init__(self):
+    def __init__(self, model: Optional[ChatOpenAI] = None):
         """
-        Initialize the verification agent with the Open AI.
+        Initialize the verification agent with the Open AI (shared HTTP pool unless injected).
         """
 
         # Initialize the OpenAI Model llm
         print("Initializing ResearchAgent with OPEN AI...")
 
-        self.model = ChatOpenAI(
-            model="gpt-4.1-mini",
-            api_key=OPENAI_API_KEY,
+        self.model = model or get_chat_model(
             max_tokens=40,   # Adjust based on desired response length
             temperature=0.0,   # Controls randomness; lower values make output more deterministic
         )
@@ -143,13 +142,36 @@ class VerificationAgent:
         except Exception as e:
             print(f"Error during model inference: {e}")
             raise RuntimeError("Failed to verify answer due to a model error.") from e
+        return self._build_report(response, context)
+
+    async def acheck(self, answer: str, documents: List[Document]) -> Dict[str, Any]:
+        """
+        Async variant of check(): awaits the LLM instead of blocking the caller.
+        """
+        logger.debug(f"VerificationAgent.acheck called with {len(documents)} documents.")
+        context = "\n\n".join([doc.page_content for doc in documents])
+        prompt = self.generate_prompt(answer, context)
+        try:
+            await openai_rate_limiter.acquire(
+                estimate_tokens(prompt, self.model.max_tokens or 0)
+            )
+            response = await self.model.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.error(f"Error during model inference: {e}")
+            raise RuntimeError("Failed to verify answer due to a model error.") from e
+        return self._build_report(response, context)
+
+    def _build_report(self, response, context: str) -> Dict[str, Any]:
+        """
+        Turn the raw LLM response into the formatted verification report.
+        """
         # Extract and process the LLM's response
         try:
 
             llm_response = (response.content or "").strip()
-            print(f"Raw LLM response:\n{llm_response}")
+            logger.debug(f"Raw LLM response ({len(llm_response)} chars)")
         except Exception as e:
-            print(f"Unexpected response structure: {e}")
+            logger.error(f"Unexpected response structure: {e}")
 
 
             verification_report = {
@@ -160,8 +182,7 @@ class VerificationAgent:
                 "Additional Details": "Invalid response structure from the model."
             }
             verification_report_formatted = self.format_verification_report(verification_report)
-            print(f"Verification report:\n{verification_report_formatted}")
-            print(f"Context used: {context}")
+            logger.debug(f"Verification report:\n{verification_report_formatted}")
             return {
                 "verification_report": verification_report_formatted,
                 "context_used": context
@@ -169,7 +190,7 @@ class VerificationAgent:
         # Sanitize the response
         sanitized_response = self.sanitize_response(llm_response) if llm_response else ""
         if not sanitized_response:
-            print("LLM returned an empty response.")
+            logger.debug("LLM returned an empty response.")
             verification_report = {
                 "Supported": "NO",
                 "Unsupported Claims": [],
@@ -181,7 +202,7 @@ class VerificationAgent:
             # Parse the response into the expected format
             verification_report = self.parse_verification_response(sanitized_response)
             if verification_report is None:
-                print("LLM did not respond with the expected format. Using default verification report.")
+                logger.debug("LLM did not respond with the expected format. Using default verification report.")
                 verification_report = {
                     "Supported": "NO",
                     "Unsupported Claims": [],
@@ -191,8 +212,7 @@ class VerificationAgent:
                 }
         # Format the verification report into a paragraph
         verification_report_formatted = self.format_verification_report(verification_report)
-        print(f"Verification report:\n{verification_report_formatted}")
-        print(f"Context used: {context}")
+        logger.debug(f"Verification report:\n{verification_report_formatted}")
         return {
             "verification_report": verification_report_formatted,
             "context_used": context
@@ -1,10 +1,15 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict
+import asyncio
+from typing import TypedDict, List, Dict, Tuple
 from .research_agent import ResearchAgent
 from .verification_agent import VerificationAgent
 from .relevance_checker import RelevanceChecker
 from langchain_classic.retrievers import EnsembleRetriever
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from config.settings import settings
+from llm.openai_llm import get_chat_model
+from llm.token_budget import build_context
 
 
 import logging
@@ -23,17 +28,16 @@ class AgentState(TypedDict):
 
 class AgentWorkflow:
     def __init__(self):
-        self.researcher = ResearchAgent()
-        self.verifier = VerificationAgent()
-        self.relevance_checker = RelevanceChecker()
-        self.compiled_workflow = self.build_workflow()
-
-    def _check_relevance_step(self, state: AgentState) -> Dict:
-        retriever = state["retriever"]
-        classification = self.relevance_checker.check(
-            question=state["question"], retriever=retriever, k=20
+        # One ChatOpenAI per config, all sharing a single HTTP/2 connection pool
+        self.researcher = ResearchAgent(model=get_chat_model(max_tokens=80, temperature=0.2))
+        self.verifier = VerificationAgent(model=get_chat_model(max_tokens=40, temperature=0.0))
+        self.relevance_checker = RelevanceChecker(
+            model=get_chat_model(max_tokens=1, temperature=0, top_logprobs=5),
+            joint_model=get_chat_model(max_tokens=120, temperature=0, json_mode=True),
         )
+        self.compiled_workflow = self.build_workflow()
 
+    def _relevance_update(self, classification: str) -> Dict:
         if classification == "CAN_ANSWER":
             # We have enough info to proceed
             return {"is_relevant": True}
@@ -46,9 +50,73 @@ class AgentWorkflow:
                 "draft_answer": "This question isn't related (or there's no data) for your query. Please ask another question relevant to the uploaded document(s).",
             }
 
+    def _joint_update(self, result: Dict) -> Dict:
+        update = self._relevance_update(result["label"])
+        if update["is_relevant"] and result["answer"]:
+            # The draft came back with the label; research is skipped
+            update["draft_answer"] = result["answer"]
+        return update
+
+    def _relevance_context(self, state: AgentState, k: int = 20) -> str:
+        # Same question against the same retriever: reuse the documents already
+        # retrieved by full_pipeline instead of issuing a second retrieval.
+        # The joint call also drafts the answer, so it gets the research budget.
+        return build_context(state["documents"], settings.RESEARCH_MAX_CTX_TOKENS, k=k)
+
+    def _check_relevance_step(self, state: AgentState) -> Dict:
+        if not state["documents"]:
+            return self._relevance_update("NO_MATCH")
+        # A clear miss skips the LLM; everything else gets the joint label+draft call
+        gated = self.relevance_checker.gate(state["documents"])
+        if gated is not None:
+            return self._relevance_update(gated)
+        result = self.relevance_checker.classify_and_answer(
+            question=state["question"], context=self._relevance_context(state)
+        )
+        if result["label"] is None:
+            # Joint output unusable: label-only call, then the research node drafts
+            label = self.relevance_checker.classify(state["question"], state["documents"], k=20)
+            return self._relevance_update(label)
+        return self._joint_update(result)
+
+    async def _acheck_relevance_step(self, state: AgentState) -> Dict:
+        if not state["documents"]:
+            return self._relevance_update("NO_MATCH")
+        gated = self.relevance_checker.gate(state["documents"])
+        if gated is not None:
+            return self._relevance_update(gated)
+        result = await self.relevance_checker.aclassify_and_answer(
+            question=state["question"], context=self._relevance_context(state)
+        )
+        if result["label"] is None:
+            label = await self.relevance_checker.aclassify(state["question"], state["documents"], k=20)
+            return self._relevance_update(label)
+        return self._joint_update(result)
+
+    async def aretrieve_and_check(self, question: str, retriever) -> Tuple[List[Document], Dict]:
+        """
+        Retrieve documents and decide relevance (gate, then label-only LLM call)
+        for callers that draft the answer themselves, e.g. the token-streaming
+        endpoint. The steps run one after another: the gate reads the vector
+        scores attached by this retrieval, so there is no second similarity
+        search left to overlap with it.
+        """
+        documents = await retriever.ainvoke(question)
+        if not documents:
+            return documents, self._relevance_update("NO_MATCH")
+        classification = self.relevance_checker.gate(documents)
+        if classification is None:
+            classification = await self.relevance_checker.aclassify(question, documents, k=20)
+        return documents, self._relevance_update(classification)
+
     def _decide_after_relevance_check(self, state: AgentState) -> str:
-        decision = "relevant" if state["is_relevant"] else "irrelevant"
-        print(f"[DEBUG] _decide_after_relevance_check -> {decision}")
+        if not state["is_relevant"]:
+            decision = "irrelevant"
+        elif state["draft_answer"]:
+            decision = "drafted"
+        else:
+            decision = "relevant"
+        logger.debug(f"_decide_after_relevance_check -> {decision}")
         return decision
         pass
 
@@ -58,17 +126,25 @@ class AgentWorkflow:
         print("[DEBUG] Researcher returned draft answer.")
         return {"draft_answer": result["draft_answer"]}
 
+    async def _aresearch_step(self, state: AgentState) -> Dict:
+        logger.debug("Entered _aresearch_step")
+        result = await self.researcher.agenerate(state["question"], state["documents"])
+        return {"draft_answer": result["draft_answer"]}
+
     def _verification_step(self, state: AgentState) -> Dict:
         print("[DEBUG] Entered _verification_step. Verifying the draft answer...")
         result = self.verifier.check(state["draft_answer"], state["documents"])
         print("[DEBUG] VerificationAgent returned a verification report.")
         return {"verification_report": result["verification_report"]}
 
+    async def _averification_step(self, state: AgentState) -> Dict:
+        logger.debug("Entered _averification_step")
+        result = await self.verifier.acheck(state["draft_answer"], state["documents"])
+        return {"verification_report": result["verification_report"]}
+
     def _decide_next_step(self, state: AgentState) -> str:
         verification_report = state["verification_report"]
-        print(
-            f"[DEBUG] _decide_next_step with verification_report='{verification_report}'"
-        )
+        logger.debug("_decide_next_step: checking verification report")
 
         if (
             "Supported: NO" in verification_report
@@ -89,17 +165,28 @@ class AgentWorkflow:
 
         workflow = StateGraph(AgentState)
 
-        # Add nodes (Nodes represent different stages)
-        workflow.add_node("check_relevance", self._check_relevance_step)
-        workflow.add_node("research", self._research_step)
-        workflow.add_node("verify", self._verification_step)
+        # Add nodes (Nodes represent different stages).
+        # Each node carries a sync and an async implementation so the same
+        # graph serves both compiled_workflow.invoke and .ainvoke.
+        workflow.add_node(
+            "check_relevance",
+            RunnableLambda(self._check_relevance_step, afunc=self._acheck_relevance_step),
+        )
+        workflow.add_node(
+            "research",
+            RunnableLambda(self._research_step, afunc=self._aresearch_step),
+        )
+        workflow.add_node(
+            "verify",
+            RunnableLambda(self._verification_step, afunc=self._averification_step),
+        )
 
         # Define edges (Edges define transitions based on conditions.)
         workflow.set_entry_point("check_relevance")
         workflow.add_conditional_edges(
             "check_relevance",
             self._decide_after_relevance_check,
-            {"relevant": "research", "irrelevant": END},
+            {"relevant": "research", "drafted": "verify", "irrelevant": END},
         )
         workflow.add_edge("research", "verify")
         workflow.add_conditional_edges(
@@ -107,28 +194,100 @@ class AgentWorkflow:
         )
         return workflow.compile()
 
+    def _initial_state(self, question: str, documents: List[Document], retriever) -> AgentState:
+        return AgentState(
+            question=question,
+            documents=documents,
+            draft_answer="",
+            verification_report="",
+            is_relevant=False,
+            retriever=retriever,
+        )
+
+    def _result(self, final_state: AgentState) -> Dict:
+        return {
+            "draft_answer": final_state["draft_answer"],
+            "verification_report": final_state["verification_report"],
+            "is_relevant": final_state["is_relevant"],
+            "documents": final_state["documents"]
+        }
+
     def full_pipeline(self, question: str, retriever: EnsembleRetriever):
         try:
             print(f"[DEBUG] Starting full_pipeline with question='{question}'")
             documents = retriever.invoke(question)
             logger.info(f"Retrieved {len(documents)} relevant documents (from .invoke)")
-            initial_state = AgentState(
-                question=question,
-                documents=documents,
-                draft_answer="",
-                verification_report="",
-                is_relevant=False,
-                retriever=retriever,
-            )
+            initial_state = self._initial_state(question, documents, retriever)
 
             final_state = self.compiled_workflow.invoke(initial_state)
             
 
-            return {
-                "draft_answer": final_state["draft_answer"],
-                "verification_report": final_state["verification_report"],
-                "documents": final_state["documents"]
-            }
+            return self._result(final_state)
+        except Exception as e:
+            logger.error(f"Workflow execution failed: {e}")
+            raise
+
+    async def afull_pipeline(self, question: str, retriever: EnsembleRetriever):
+        """
+        Async variant of full_pipeline(): every retrieval and LLM call is awaited,
+        so concurrent requests share the event loop instead of worker threads.
+        """
+        try:
+            logger.debug("Starting afull_pipeline")
+            documents = await retriever.ainvoke(question)
+            logger.info(f"Retrieved {len(documents)} relevant documents (from .ainvoke)")
+            initial_state = self._initial_state(question, documents, retriever)
+
+            final_state = await self.compiled_workflow.ainvoke(initial_state)
+
+            return self._result(final_state)
         except Exception as e:
             logger.error(f"Workflow execution failed: {e}")
             raise
+
+    async def abatch_pipeline(self, questions: List[str], retriever: EnsembleRetriever) -> List[Dict]:
+        """
+        Answer several questions against the same retriever.
+        Relevance is classified with batched LLM calls, then research and
+        verification fan out concurrently over the relevant questions.
+        Single pass per question (no re-research loop).
+        """
+        try:
+            logger.debug(f"Starting abatch_pipeline with {len(questions)} questions")
+            # Retrieval (query embeddings) and verification fan out under the same
+            # LLM_MAX_CONCURRENCY bound as research, so one batch can't take the
+            # whole upstream budget at once
+            sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+            async def bounded(coro):
+                async with sem:
+                    return await coro
+
+            documents = list(
+                await asyncio.gather(*[bounded(retriever.ainvoke(q)) for q in questions])
+            )
+            labels = await self.relevance_checker.classify_batch(questions, documents, k=20)
+
+            results = []
+            for question, docs, label in zip(questions, documents, labels):
+                state = self._initial_state(question, docs, retriever)
+                state.update(self._relevance_update(label))
+                results.append(state)
+
+            relevant = [r for r in results if r["is_relevant"]]
+            drafts = await self.researcher.generate_many(
+                [(r["question"], r["documents"]) for r in relevant]
+            )
+            for r, draft in zip(relevant, drafts):
+                r["draft_answer"] = draft["draft_answer"]
+
+            reports = await asyncio.gather(
+                *[bounded(self.verifier.acheck(r["draft_answer"], r["documents"])) for r in relevant]
+            )
+            for r, report in zip(relevant, reports):
+                r["verification_report"] = report["verification_report"]
+
+            return [self._result(r) for r in results]
+        except Exception as e:
+            logger.error(f"Batch workflow execution failed: {e}")
+            raise
@@ -0,0 +1,46 @@
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from diskcache import Cache
+
+from config.settings import settings
+from utils.logging import logger
+
+
+class QACache:
+    """
+     - On-disk LRU of finished answers keyed by (question, doc, file fingerprint)
+     - The fingerprint is part of the key, so editing a PDF invalidates its
+       entries without any explicit cleanup
+    """
+
+    def __init__(self, directory: str = str(Path(settings.CACHE_DIR) / "qa")):
+        self._cache = Cache(
+            directory,
+            size_limit=settings.QA_CACHE_SIZE_LIMIT,
+            eviction_policy="least-recently-used",
+        )
+
+    # Builds the cache key for one question against one version of a doc.
+    def make_key(
+        self, question: str, doc_id: str, fingerprint: str, top_k_sources: int, max_source_chars: int = 0
+    ) -> str:
+        raw = f"{question.strip().lower()}|{doc_id}|{fingerprint}|{top_k_sources}|{max_source_chars}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._cache.get(key)
+        except Exception as e:
+            logger.error(f"QA cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            self._cache.set(key, value, expire=settings.CACHE_EXPIRE_DAYS * 86400)
+        except Exception as e:
+            logger.error(f"QA cache write failed: {e}")
+
+
+qa_cache = QACache()
@@ -17,12 +17,33 @@ class Settings(BaseSettings):
     VECTOR_SEARCH_K: int = 10
     HYBRID_RETRIEVER_WEIGHTS: list = [0.4, 0.6]
 
+    # Embedding settings
+    EMBED_BATCH_SIZE: int = 512         # texts per OpenAI embeddings request
+    EMBED_MAX_CONCURRENCY: int = 4      # embedding requests in flight per build
+
+    # Relevance gate: answer NO_MATCH without the LLM when the best vector hit's
+    # cosine similarity is below the threshold. Off by default: the threshold is
+    # embedding-model specific, so calibrate it on labeled questions first.
+    RELEVANCE_GATE_ENABLED: bool = False
+    RELEVANCE_NO_MATCH_THRESHOLD: float = 0.10
+
+    # LLM concurrency settings (client-side throttles, keep below account limits)
+    OPENAI_MAX_REQUESTS_PER_MINUTE: int = 500
+    OPENAI_MAX_TOKENS_PER_MINUTE: int = 200_000
+    LLM_MAX_CONCURRENCY: int = 16
+    RELEVANCE_BATCH_SIZE: int = 6   # questions packed into one relevance call
+
+    # Prompt context budgets (tokens of retrieved text sent per call)
+    RELEVANCE_MAX_CTX_TOKENS: int = 1500
+    RESEARCH_MAX_CTX_TOKENS: int = 3000
+
     # Logging settings
     LOG_LEVEL: str = "INFO"
 
     # New cache settings with type annotations
     CACHE_DIR: str = "document_cache"
     CACHE_EXPIRE_DAYS: int = 7
+    QA_CACHE_SIZE_LIMIT: int = 256 * 1024 * 1024   # bytes; least-recently-used entries are evicted
 
     model_config = SettingsConfigDict(
         env_file=".env",
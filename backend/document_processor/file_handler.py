@@ -1,16 +1,46 @@
 import os
 import hashlib
-import pickle
+import threading
+import msgpack
+import xxhash
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from contextlib import ExitStack
+from typing import Callable, Iterator, List, Optional, Tuple
 from docling.document_converter import DocumentConverter
+from langchain_core.documents import Document
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from config import constants
 from config.settings import settings
 from utils.logging import logger
 
 
+# Loading Docling's layout models is expensive: once per (worker) process.
+@lru_cache(maxsize=1)
+def _get_converter() -> DocumentConverter:
+    return DocumentConverter()
+
+
+# Module-level so it can be pickled into ProcessPoolExecutor workers.
+def _process_one(path_and_headers: Tuple[str, List]) -> List:
+    """Convert one file to Markdown with Docling and split it into chunks."""
+    path, headers = path_and_headers
+
+    if not path.endswith((".pdf", ".docx", ".txt", ".md")):
+        logger.warning(f"Skipping unsupported file type: {path}")
+        return []
+
+    result = _get_converter().convert(path)
+    markdown = result.document.export_to_markdown()
+    # The conversion result (page images, layout tree) dwarfs the Markdown; free it before splitting
+    del result
+    splitter = MarkdownHeaderTextSplitter(headers)
+    return splitter.split_text(markdown)
+
+
 class DocumentProcessor:
     """
      - Validating file sizes before processing
@@ -19,10 +49,20 @@ class DocumentProcessor:
      - Splitting text into chunks using MarkdownHeaderTextSplitter for better retrieval in vector databasesr
     """
     #Initializes cache directory and header settings.
-    def __init__(self):
+    def __init__(
+        self,
+        cpu_pool: Optional[Executor] = None,
+        cpu_pool_factory: Optional[Callable[[], Executor]] = None,
+    ):
         self.headers = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
         self.cache_dir = Path(settings.CACHE_DIR)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Long-lived process pool for Docling (set by the API at startup); without
+        # one, a throwaway pool is created per call for multiple misses.
+        # A worker crash (e.g. OOM) breaks the whole pool: the factory replaces it.
+        self.cpu_pool = cpu_pool
+        self.cpu_pool_factory = cpu_pool_factory
+        self._pool_lock = threading.Lock()
 
     # Ensures that uploaded files do not exceed the size limit.
     def validate_files(self, files: List) -> None:
@@ -37,68 +77,168 @@ class DocumentProcessor:
     # Handles document processing, caching, and deduplication.
     def process(self, files: List) -> List:
         """Process files with caching for subsequent queries"""
+        all_chunks = list(self.iter_chunks(files))
+        logger.info(f"Total unique chunks: {len(all_chunks)}")
+        return all_chunks
+
+    # Same as process(), but yields chunks file by file so callers can consume
+    # them incrementally. Callers that build a retriever still keep every chunk.
+    def iter_chunks(self, files: List) -> Iterator[Document]:
+        """Yield deduplicated chunks in file order, with caching."""
         self.validate_files(files)
-        all_chunks = []
-        seen_hashes = set()
+        plan = []
 
+        # 1) Serial cache lookup so already-processed files never reach the pool
         for file in files:
             try:
                 # Generate content-based hash for caching
-                with open(file.name, "rb") as f:
-                    file_hash = self._generate_hash(f.read())
+                file_hash = self._generate_file_hash(file.name)
 
-                cache_path = self.cache_dir / f"{file_hash}.pkl"
+                cache_path = self.cache_dir / f"{file_hash}.msgpack"
+                plan.append((file, cache_path, self._is_cache_valid(cache_path)))
 
-                if self._is_cache_valid(cache_path):
-                    logger.info(f"Loading from cache: {file.name}")
-                    chunks = self._load_from_cache(cache_path)
-                else:
-                    logger.info(f"Processing and caching: {file.name}")
-                    chunks = self._process_file(file)
-                    self._save_to_cache(chunks, cache_path)
+            except Exception as e:
+                logger.error(f"Failed to process {file.name}: {str(e)}")
+                continue
 
-                # Deduplicate chunks across files
+        seen_hashes = set()
+        with ExitStack() as stack:
+            # 2) Docling conversion is CPU-bound: all cache misses start at once
+            misses = [(file, cache_path) for file, cache_path, hit in plan if not hit]
+            pending = iter(self._start_misses(misses, stack))
+
+            for file, cache_path, hit in plan:
+                try:
+                    if hit:
+                        logger.info(f"Loading from cache: {file.name}")
+                        chunks = self._load_from_cache(cache_path)
+                    else:
+                        # Submit errors surface here too, so they stay per-file
+                        chunks = next(pending)()
+                        self._save_to_cache(chunks, cache_path)
+                except Exception as e:
+                    logger.error(f"Failed to process {file.name}: {str(e)}")
+                    continue
+
+                # 3) Deduplicate chunks across files, in the original file order
                 for chunk in chunks:
-                    chunk_hash = self._generate_hash(chunk.page_content.encode())
+                    chunk_hash = self._fast_fingerprint(chunk.page_content.encode("utf-8", "ignore"))
                     if chunk_hash not in seen_hashes:
-                        all_chunks.append(chunk)
                         seen_hashes.add(chunk_hash)
+                        yield chunk
 
-            except Exception as e:
-                logger.error(f"Failed to process {file.name}: {str(e)}")
-                continue
+    # Starts Docling on cache misses and returns one result getter per miss, in
+    # order; without a shared pool, a single file skips the pool start-up cost
+    # and runs in-process when requested.
+    def _start_misses(self, misses: List, stack: ExitStack) -> List[Callable[[], List]]:
+        if not misses:
+            return []
 
-        logger.info(f"Total unique chunks: {len(all_chunks)}")
-        return all_chunks
+        if self.cpu_pool is not None:
+            getters = []
+            for file, _ in misses:
+                logger.info(f"Processing and caching: {file.name}")
+                getters.append(self._submit_shared(file))
+            return getters
+
+        if len(misses) == 1:
+            file, _ = misses[0]
+            logger.info(f"Processing and caching: {file.name}")
+            return [lambda: self._process_file(file)]
+
+        max_workers = min(os.cpu_count() or 1, len(misses))
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers))
+        getters = []
+        for file, _ in misses:
+            logger.info(f"Processing and caching: {file.name}")
+            getters.append(pool.submit(_process_one, (file.name, self.headers)).result)
+        return getters
+
+    # Queues one file on the shared pool. A BrokenProcessPool (pool already
+    # broken, or a worker died mid-conversion) replaces the pool and resubmits
+    # once; any other error, or a second crash, only fails this file.
+    def _submit_shared(self, file) -> Callable[[], List]:
+        args = (file.name, self.headers)
+
+        def submit() -> Tuple[Executor, Future]:
+            pool = self.cpu_pool
+            try:
+                return pool, pool.submit(_process_one, args)
+            except BrokenProcessPool:
+                self._replace_cpu_pool(pool)
+                pool = self.cpu_pool
+                return pool, pool.submit(_process_one, args)
+
+        try:
+            pool, fut = submit()
+        except Exception as e:
+            error = e
+
+            def failed() -> List:
+                raise error
+
+            return failed
+
+        def get() -> List:
+            try:
+                return fut.result()
+            except BrokenProcessPool:
+                logger.warning(f"Docling worker died converting {file.name}; retrying on a fresh pool")
+                self._replace_cpu_pool(pool)
+                return submit()[1].result()
+
+        return get
+
+    # Swaps in a new pool unless another caller already replaced `broken`.
+    def _replace_cpu_pool(self, broken: Executor) -> None:
+        with self._pool_lock:
+            if self.cpu_pool is not broken:
+                return
+            if self.cpu_pool_factory is None:
+                raise BrokenProcessPool("Docling worker pool is broken and cannot be rebuilt")
+            logger.warning("Docling worker pool is broken; starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.cpu_pool = self.cpu_pool_factory()
 
     # Converts a document into Markdown and splits it into chunks.
     def _process_file(self, file) -> List:
         """Original processing logic with Docling"""
 
-        if not file.name.endswith((".pdf", ".docx", ".txt", ".md")):
-            logger.warning(f"Skipping unsupported file type: {file.name}")
-            return []
-
-        converter = DocumentConverter()
-        markdown = converter.convert(file.name).document.export_to_markdown()
-        splitter = MarkdownHeaderTextSplitter(self.headers)
-        return splitter.split_text(markdown)
+        return _process_one((file.name, self.headers))
 
     # Creates a unique hash of file content.
     def _generate_hash(self, content: bytes) -> str:
 
         return hashlib.sha256(content).hexdigest()
 
-    # Saves processed document chunks to cache.
+    # Hashes a file on disk in fixed-size blocks instead of reading it whole.
+    def _generate_file_hash(self, path: str) -> str:
+
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    # Fast 128-bit fingerprint for in-memory chunk deduplication (not for storage).
+    def _fast_fingerprint(self, content: bytes) -> bytes:
+
+        return xxhash.xxh3_128_digest(content)
+
+    # Saves processed document chunks to cache (plain msgpack data, no pickled objects).
     def _save_to_cache(self, chunks: List, cache_path: Path):
         with open(cache_path, "wb") as f:
-            pickle.dump({"timestamp": datetime.now().timestamp(), "chunks": chunks}, f)
+            msgpack.pack(
+                {
+                    "ts": datetime.now().timestamp(),
+                    "chunks": [{"c": c.page_content, "m": c.metadata} for c in chunks],
+                },
+                f,
+                use_bin_type=True,
+            )
 
     # Loads cached document chunks if available.
     def _load_from_cache(self, cache_path: Path) -> List:
         with open(cache_path, "rb") as f:
-            data = pickle.load(f)
-        return data["chunks"]
+            data = msgpack.unpack(f, raw=False)
+        return [Document(page_content=d["c"], metadata=d["m"]) for d in data["chunks"]]
 
     # Checks if a cached file is still valid.
     def _is_cache_valid(self, cache_path: Path) -> bool:
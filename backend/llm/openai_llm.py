@@ -1,7 +1,9 @@
-
 import os
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
 load_dotenv()
+import httpx
 from langchain_openai import ChatOpenAI
 
 
@@ -10,4 +12,41 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 model = ChatOpenAI(
     api_key=OPENAI_API_KEY, 
     model="gpt-4.1-mini"
-)
\ No newline at end of file
+)
+
+# One connection pool for all LLM traffic: keep-alive plus HTTP/2 multiplexing
+# lets concurrent agent calls share a single TCP+TLS connection
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+@lru_cache(maxsize=1)
+def get_shared_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=_HTTP_LIMITS, http2=True)
+
+
+@lru_cache(maxsize=1)
+def get_shared_sync_http_client() -> httpx.Client:
+    # Sync code paths (full_pipeline, check, generate) cannot use the async client
+    return httpx.Client(limits=_HTTP_LIMITS, http2=True)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(
+    max_tokens: int,
+    temperature: float,
+    json_mode: bool = False,
+    top_logprobs: Optional[int] = None,
+) -> ChatOpenAI:
+    """One ChatOpenAI per config, all on the shared HTTP clients.
+    `top_logprobs` also turns on `logprobs` for the first generated tokens."""
+    return ChatOpenAI(
+        model="gpt-4.1-mini",
+        api_key=OPENAI_API_KEY,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        http_client=get_shared_sync_http_client(),
+        http_async_client=get_shared_http_client(),
+        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {},
+        logprobs=True if top_logprobs else None,
+        top_logprobs=top_logprobs,
+    )
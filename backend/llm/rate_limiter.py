@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from config.settings import settings
+
+
+class RateLimiter:
+    """
+    Client-side throttle for OpenAI calls.
+     - Tracks request and token capacity that refills continuously per minute
+     - Callers await acquire() before issuing a request, so concurrent
+       batches stay under the account's RPM / TPM limits instead of
+       bouncing off 429s
+    """
+
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self._available_requests = max_requests_per_minute
+        self._available_tokens = max_tokens_per_minute
+        self._last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._available_requests = min(
+            self._available_requests + self.max_requests_per_minute * elapsed / 60.0,
+            self.max_requests_per_minute,
+        )
+        self._available_tokens = min(
+            self._available_tokens + self.max_tokens_per_minute * elapsed / 60.0,
+            self.max_tokens_per_minute,
+        )
+        self._last_update = now
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request and `tokens` tokens of capacity are available."""
+        # A single oversized request must still be able to go through eventually
+        tokens = min(tokens, self.max_tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._available_requests >= 1 and self._available_tokens >= tokens:
+                    self._available_requests -= 1
+                    self._available_tokens -= tokens
+                    return
+
+                missing_requests = max(0.0, 1 - self._available_requests)
+                missing_tokens = max(0.0, tokens - self._available_tokens)
+                wait = max(
+                    missing_requests * 60.0 / self.max_requests_per_minute,
+                    missing_tokens * 60.0 / self.max_tokens_per_minute,
+                )
+                await asyncio.sleep(wait)
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Rough prompt + completion token estimate (~4 characters per token)."""
+    return len(prompt) // 4 + max_tokens
+
+
+# Shared by every agent so all LLM traffic draws from the same budget
+openai_rate_limiter = RateLimiter(
+    max_requests_per_minute=settings.OPENAI_MAX_REQUESTS_PER_MINUTE,
+    max_tokens_per_minute=settings.OPENAI_MAX_TOKENS_PER_MINUTE,
+)
@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import List, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+
+from utils.logging import logger
+
+CONTEXT_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    """Shared tokenizer for gpt-4.1-mini; None if the BPE file cannot be loaded."""
+    try:
+        return tiktoken.encoding_for_model("gpt-4.1-mini")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, budgeting by characters instead: {e}")
+        return None
+
+
+def build_context(documents: List[Document], max_tokens: int, k: Optional[int] = None) -> str:
+    """
+    Join document texts in retrieval (score) order until `max_tokens` is reached.
+    The chunk that crosses the budget is cut at the token boundary; the rest are dropped.
+    """
+    docs = documents[:k] if k is not None else documents
+    enc = _get_encoding()
+    parts = []
+    remaining = max_tokens
+
+    for doc in docs:
+        if remaining <= 0:
+            break
+        text = doc.page_content
+        if enc is None:
+            # ~4 characters per token
+            if len(text) > remaining * 4:
+                text = text[: remaining * 4]
+            remaining -= len(text) // 4 + 1
+        else:
+            ids = enc.encode(text)
+            if len(ids) > remaining:
+                text = enc.decode(ids[:remaining])
+            remaining -= min(len(ids), remaining) + 1  # + separator
+        parts.append(text)
+
+    return CONTEXT_SEPARATOR.join(parts)
@@ -1,22 +1,31 @@
 import os
-import json
 import time
 import asyncio
-import hashlib
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Any, Dict
-from contextlib import asynccontextmanager
+from typing import Annotated, Callable, List, Optional, Any, Dict, Tuple
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
 import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
+import anyio.to_thread
+import orjson
+import xxhash
 from sse_starlette.sse import EventSourceResponse
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+from langchain_core.documents import Document
 
 from document_processor.file_handler import DocumentProcessor
 from retriever.builder import RetrieverBuilder
 from agents.workflow import AgentWorkflow
+from cache.qa_cache import qa_cache
+from llm.openai_llm import get_shared_http_client, get_shared_sync_http_client
+from utils.logging import logger
 
 # ----------------------------
 # Built-in docs (dropdown-only mode)
@@ -24,29 +33,102 @@ from agents.workflow import AgentWorkflow
 EXAMPLES_DIR = Path("examples")
 
 _DOC_IDS: List[str] = []
-_DOC_PATHS: Dict[str, str] = {}              # doc_id -> absolute path
-_RETRIEVER_BY_DOC: Dict[str, Any] = {}       # doc_id -> retriever
-_DOC_FP: Dict[str, str] = {}                 # doc_id -> fingerprint (mtime+size path)
-
-# Prevent duplicate retriever builds under concurrent traffic
-_RETRIEVER_LOCK = threading.Lock()
+_DOC_PATHS: Dict[str, Path] = {}             # doc_id -> resolved path
+# doc_id -> (fp token, retriever). The pair is published as one immutable tuple,
+# so lock-free readers always see a retriever together with the fp it was built from.
+_RETRIEVER_BY_DOC: Dict[str, Tuple[str, Any]] = {}
+# doc_id -> (path, mtime_ns, size, inode) as of the last examples/ scan. Requests
+# read it as-is; files are only stat'ed again when the scan TTL expires.
+_DOC_FP: Dict[str, Tuple[str, int, int, int]] = {}
+_EXAMPLES_DIR_MTIME = 0                      # EXAMPLES_DIR st_mtime_ns at the last /api/docs scan
+_LAST_SCAN = 0.0                             # time.monotonic() of the last examples/ scan
+_SCAN_EPOCH = 0                              # bumped whenever a scan changes the set of doc ids
+# examples/ is rescanned at most this often (seconds). Example:
+#   export DOCS_SCAN_TTL=30
+_SCAN_TTL = float(os.getenv("DOCS_SCAN_TTL", "5"))
+
+# Built retrievers survive restarts: Chroma persists its collections, the builder
+# pickles BM25 next to them, and this index records which file fingerprint each
+# was built from
+RETRIEVER_CACHE_DIR = EXAMPLES_DIR / ".retriever_cache"
+_RETRIEVER_INDEX_PATH = RETRIEVER_CACHE_DIR / "index.json"
+_RETRIEVER_INDEX: Dict[str, Dict[str, str]] = {}   # doc_id -> {fp, chroma_collection, bm25_pkl_path}
+
+# Prevent duplicate retriever builds under concurrent traffic: the first caller
+# for a doc publishes a Future and builds; later callers wait on that Future.
+# Builds of different docs run in parallel. _LOCKS_LOCK only guards the map.
+_IN_FLIGHT: Dict[str, Future] = {}
+_LOCKS_LOCK = threading.Lock()
+
+# Serializes writes of the shared index file from concurrent builds
+_INDEX_LOCK = threading.Lock()
 
 _APP_START_TS = time.time()
 
+# Only these chunk metadata keys are sent to the client with each source
+_SOURCE_METADATA_KEYS = ("doc_id", "source", "Header 1", "Header 2")
+
+# Worker threads for blocking work (sync endpoints and asyncio.to_thread).
+# Example:
+#   export FASTAPI_THREADS=100
+FASTAPI_THREADS = int(os.getenv("FASTAPI_THREADS", "100"))
+# Pipeline runs allowed at once; beyond that /api/ask* answer 503 immediately.
+# Set it just above the point where LLM calls start hitting upstream rate limits:
+#   export ASK_MAX_INFLIGHT=8
+ASK_MAX_INFLIGHT = int(os.getenv("ASK_MAX_INFLIGHT", "8"))
+
+def _new_cpu_pool() -> ProcessPoolExecutor:
+    # "spawn": never fork a threaded server
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- startup ---
+    # Size both pools explicitly instead of relying on anyio's hidden default of 40
+    anyio.to_thread.current_default_thread_limiter().total_tokens = FASTAPI_THREADS
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=FASTAPI_THREADS, thread_name_prefix="docchat")
+    )
+    # CPU-bound Docling conversion runs in worker processes, off the GIL the
+    # event loop and request threads share; the processor rebuilds the pool
+    # from the same factory if a worker crash breaks it
+    processor.cpu_pool_factory = _new_cpu_pool
+    processor.cpu_pool = _new_cpu_pool()
     EXAMPLES_DIR.mkdir(parents=True, exist_ok=True)
-    _load_builtin_docs()
+    _load_builtin_docs(force=True)
+    _load_retriever_index()
+    # On by default (restarts mostly reopen persisted retrievers); for fast dev reloads:
+    #   export WARMUP_ON_START=0
+    # Runs in the background so /health answers while a cold start is still
+    # building; early queries share the in-flight build for their doc.
+    warmup_task = None
+    if os.getenv("WARMUP_ON_START", "1") == "1":
+        warmup_task = asyncio.create_task(_warm_retrievers())
     yield
     # --- shutdown ---
+    if warmup_task is not None:
+        warmup_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup_task
+    cpu_pool, processor.cpu_pool = processor.cpu_pool, None
+    cpu_pool.shutdown(wait=False, cancel_futures=True)
+    await get_shared_http_client().aclose()
+    get_shared_sync_http_client().close()
     # optional cleanup:
     # _RETRIEVER_BY_DOC.clear()
 
 # ----------------------------
 # App + CORS
 # ----------------------------
-app = FastAPI(title="Agentic DocChat API", version="0.2.1", lifespan=lifespan)
+app = FastAPI(
+    title="Agentic DocChat API",
+    version="0.2.1",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS: set via env for prod safety
 # Example:
@@ -79,6 +161,16 @@ class AskRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=4000, description="User question")
     doc_id: str = Field(..., min_length=1, description="Selected built-in PDF (filename from /api/docs)")
     top_k_sources: int = Field(default=5, ge=0, le=50, description="How many source chunks to return")
+    max_source_chars: int = Field(default=500, ge=0, description="Truncate each source's content (0 = full text)")
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[Annotated[str, Field(max_length=4000)]] = Field(
+        ..., min_length=1, max_length=32, description="User questions"
+    )
+    doc_id: str = Field(..., min_length=1, description="Selected built-in PDF (filename from /api/docs)")
+    top_k_sources: int = Field(default=5, ge=0, le=50, description="How many source chunks to return per question")
+    max_source_chars: int = Field(default=500, ge=0, description="Truncate each source's content (0 = full text)")
 
 
 class SourceItem(BaseModel):
@@ -93,6 +185,10 @@ class AskResponse(BaseModel):
     verification_report: Optional[str] = None
     sources: List[SourceItem] = Field(default_factory=list)
 
+
+class AskBatchResponse(BaseModel):
+    results: List[AskResponse] = Field(default_factory=list)
+
 # ----------------------------
 # Helpers
 # ----------------------------
@@ -101,40 +197,195 @@ class LocalFile:
     name: str
 
 
-def _fingerprint_path(path: str) -> str:
-    """Changes when file changes on disk (mtime/size), includes absolute path."""
-    ap = os.path.abspath(path)
-    st = os.stat(ap)
-    h = hashlib.sha256()
-    h.update(ap.encode("utf-8"))
-    h.update(str(st.st_mtime_ns).encode("utf-8"))
-    h.update(str(st.st_size).encode("utf-8"))
-    return h.hexdigest()
+class RequestLimiter:
+    """
+    Caps concurrent pipeline runs. When every slot is taken the request is
+    rejected with 503 right away instead of queueing behind the others.
+    """
 
+    def __init__(self, max_concurrent: int):
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.rejected = 0
+
+    def check(self, endpoint: str) -> None:
+        """Raise 503 (and count the rejection) if no slot is free right now."""
+        if self._sem.locked():
+            self.rejected += 1
+            logger.warning(
+                f"Load shed on {endpoint}: {self.max_concurrent} pipelines in flight "
+                f"(rejected_total={self.rejected})"
+            )
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
 
-def _load_builtin_docs() -> None:
-    """Build dropdown list from examples/*.pdf. Does NOT build retrievers."""
-    global _DOC_IDS, _DOC_PATHS, _DOC_FP
+    async def acquire(self, endpoint: str) -> Callable[[], None]:
+        """
+        Take a slot now or raise 503; never queues. Returns an idempotent
+        release(), for holders that outlive this call (e.g. an SSE generator).
+        """
+        self.check(endpoint)
+        # A free slot was just seen: acquire() takes it without suspending
+        await self._sem.acquire()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._sem.release()
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str):
+        release = await self.acquire(endpoint)
+        try:
+            yield
+        finally:
+            release()
 
-    pdfs = sorted(EXAMPLES_DIR.glob("*.pdf"))
-    _DOC_IDS = [p.name for p in pdfs]
-    _DOC_PATHS = {p.name: str(p.resolve()) for p in pdfs}
-    _DOC_FP = {p.name: _fingerprint_path(str(p.resolve())) for p in pdfs}
 
+ask_limiter = RequestLimiter(ASK_MAX_INFLIGHT)
 
-def _validate_doc_id(doc_id: str) -> str:
-    """Only allow known doc IDs discovered from EXAMPLES_DIR."""
+
+def _fingerprint_path(path: Path) -> Tuple[str, int, int, int]:
+    """Changes when file changes on disk (mtime/size/inode), includes the path.
+    `path` must already be resolved. Change detection only, so the stat result
+    itself is enough; nothing is hashed."""
+    st = path.stat()
+    return (str(path), st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _fp_token(fp: Tuple[str, int, int, int]) -> str:
+    """String form of a fingerprint, for the persisted index and cache keys."""
+    _, mtime_ns, size, ino = fp
+    return f"{mtime_ns}-{size}-{ino}"
+
+
+def _load_builtin_docs(force: bool = False) -> None:
+    """
+    Build dropdown list from examples/*.pdf. Does NOT build retrievers.
+    No-op if the last scan is younger than DOCS_SCAN_TTL, unless `force`.
+    """
+    global _DOC_IDS, _DOC_PATHS, _DOC_FP, _LAST_SCAN, _SCAN_EPOCH
+
+    if not force and time.monotonic() - _LAST_SCAN < _SCAN_TTL:
+        return
+
+    paths: Dict[str, Path] = {}
+    fps: Dict[str, Tuple[str, int, int, int]] = {}
+    for p in sorted(EXAMPLES_DIR.glob("*.pdf")):
+        path = p.resolve()
+        try:
+            fps[p.name] = _fingerprint_path(path)
+        except OSError:
+            continue  # removed between glob and stat
+        paths[p.name] = path
+
+    if paths.keys() != _DOC_PATHS.keys():
+        _SCAN_EPOCH += 1
+    _DOC_IDS = list(paths)
+    _DOC_PATHS = paths
+    _DOC_FP = fps
+    _LAST_SCAN = time.monotonic()
+
+
+def _load_retriever_index() -> None:
+    """Read the persisted doc_id -> built-retriever index (missing/corrupt = empty)."""
+    global _RETRIEVER_INDEX
+    try:
+        _RETRIEVER_INDEX = orjson.loads(_RETRIEVER_INDEX_PATH.read_bytes())
+    except FileNotFoundError:
+        _RETRIEVER_INDEX = {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable retriever index: {e}")
+        _RETRIEVER_INDEX = {}
+
+
+def _save_retriever_index() -> None:
+    """Write the index atomically so a crash never leaves a half-written file."""
+    RETRIEVER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _RETRIEVER_INDEX_PATH.with_suffix(".json.tmp")
+    with _INDEX_LOCK:
+        tmp.write_bytes(orjson.dumps(_RETRIEVER_INDEX, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, _RETRIEVER_INDEX_PATH)
+
+
+@lru_cache(maxsize=256)
+def _validate_cached(doc_id: str, scan_epoch: int) -> str:
+    """Normalized known doc id, memoized per raw string. `scan_epoch` is part of the
+    key, so entries go stale on their own when a rescan changes the doc set.
+    Errors are raised, and so never cached."""
     doc_id = (doc_id or "").strip()
     if not doc_id:
         raise HTTPException(status_code=400, detail="Missing 'doc_id'")
+    if doc_id not in _DOC_PATHS:
+        raise HTTPException(status_code=400, detail=f"Unknown doc_id: {doc_id}")
+    return doc_id
+
 
-    # Refresh list in case PDFs were updated
+def _validate_doc_id(doc_id: str) -> str:
+    """Only allow known doc IDs discovered from EXAMPLES_DIR."""
+    # Known ids need no scan here: _current_fp() refreshes fingerprints on the TTL.
+    # Only an unknown id (maybe a newly added PDF) triggers a TTL-throttled rescan.
+    try:
+        return _validate_cached(doc_id, _SCAN_EPOCH)
+    except HTTPException:
+        if not (doc_id or "").strip():
+            raise
     _load_builtin_docs()
+    return _validate_cached(doc_id, _SCAN_EPOCH)
 
-    if doc_id not in _DOC_PATHS:
-        raise HTTPException(status_code=400, detail=f"Unknown doc_id: {doc_id}")
 
-    return doc_id
+def _current_fp(doc_id: str) -> Tuple[str, int, int, int]:
+    """Fingerprint of a known doc from the last scan; rescans once the TTL expires."""
+    _load_builtin_docs()
+    fp = _DOC_FP.get(doc_id)
+    if fp is None:
+        # Deleted since validation: the rescan dropped it
+        raise HTTPException(status_code=400, detail=f"File not found on server: {doc_id}")
+    return fp
+
+
+def _doc_fingerprint(doc_id: str) -> Tuple[str, str, str]:
+    """Validate a doc id and fetch its fingerprint: (doc_id, path, fp token)."""
+    doc_id = _validate_doc_id(doc_id)
+    fp = _current_fp(doc_id)
+    return doc_id, fp[0], _fp_token(fp)
+
+
+def _cached_retriever(doc_id: str, token: str):
+    """In-memory retriever, if it was built from the file's current version."""
+    cached = _RETRIEVER_BY_DOC.get(doc_id)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    return None
+
+
+def _claim_build(doc_id: str) -> Tuple[Future, bool]:
+    """Join the in-flight build for doc_id, or register a new one (owner=True)."""
+    with _LOCKS_LOCK:
+        fut = _IN_FLIGHT.get(doc_id)
+        if fut is not None:
+            return fut, False
+        fut = Future()
+        _IN_FLIGHT[doc_id] = fut
+        return fut, True
+
+
+def _run_build(doc_id: str, path: str, token: str, fut: Future):
+    """Owner side of a build: publish the result (or error) to every waiter via `fut`."""
+    try:
+        fut.set_result(_build_doc_retriever(doc_id, path, token))
+    except BaseException as e:
+        fut.set_exception(e)
+    finally:
+        with _LOCKS_LOCK:
+            _IN_FLIGHT.pop(doc_id, None)
 
 
 def _ensure_doc_retriever(doc_id: str):
@@ -142,47 +393,194 @@ def _ensure_doc_retriever(doc_id: str):
     Build or reuse a retriever for a built-in doc.
     Rebuild automatically if underlying file changed.
     """
-    doc_id = _validate_doc_id(doc_id)
+    doc_id, path, token = _doc_fingerprint(doc_id)
 
-    path = _DOC_PATHS[doc_id]
-    if not os.path.exists(path):
-        raise HTTPException(status_code=400, detail=f"File not found on server: {path}")
+    cached = _cached_retriever(doc_id, token)
+    if cached is not None:
+        return cached
 
-    fp = _fingerprint_path(path)
+    # One build per doc: concurrent callers wait on the same future
+    fut, owner = _claim_build(doc_id)
+    if owner:
+        _run_build(doc_id, path, token, fut)
+    return fut.result()
 
-    cached = _RETRIEVER_BY_DOC.get(doc_id)
-    if cached is not None and _DOC_FP.get(doc_id) == fp:
+
+async def _aget_doc_retriever(doc_id: str):
+    """
+    Async _ensure_doc_retriever: only the first caller for a cold doc uses a
+    worker thread; the rest await its future without blocking a thread.
+    """
+    doc_id, path, token = _doc_fingerprint(doc_id)
+
+    cached = _cached_retriever(doc_id, token)
+    if cached is not None:
         return cached
 
-    # Lock to prevent multiple threads building same retriever at once
-    with _RETRIEVER_LOCK:
-        cached = _RETRIEVER_BY_DOC.get(doc_id)
-        if cached is not None and _DOC_FP.get(doc_id) == fp:
-            return cached
+    fut, owner = _claim_build(doc_id)
+    if owner:
+        asyncio.get_running_loop().run_in_executor(None, _run_build, doc_id, path, token, fut)
+    # shield: a disconnecting client must not cancel the build the others share
+    return await asyncio.shield(asyncio.wrap_future(fut))
+
+
+def _build_doc_retriever(doc_id: str, path: str, token: str):
+    """Reopen the persisted retriever or build it; only ever run by a build owner."""
+    cached = _cached_retriever(doc_id, token)
+    if cached is not None:
+        return cached
+
+    # Built in an earlier run from the same file: reopen instead of rebuilding
+    entry = _RETRIEVER_INDEX.get(doc_id, {})
+    if doc_id not in _RETRIEVER_BY_DOC and entry.get("fp") == token:
+        try:
+            retriever = retriever_builder.load_hybrid_retriever(
+                entry["chroma_collection"], entry["bm25_pkl_path"]
+            )
+            _RETRIEVER_BY_DOC[doc_id] = (token, retriever)
+            return retriever
+        except Exception as e:
+            logger.warning(f"Persisted retriever for {doc_id} unusable, rebuilding: {e}")
+
+    files = [LocalFile(name=path)]
+    chunks = []
+    # Tag chunks as they stream out; file_handler caching stays intact
+    for c in processor.iter_chunks(files):
+        c.metadata = c.metadata or {}
+        c.metadata.update({"doc_id": doc_id, "source": doc_id})
+        chunks.append(c)
+
+    # Keep your collection naming
+    retriever = retriever_builder.build_hybrid_retriever(chunks, collection_name=doc_id)
+
+    _RETRIEVER_BY_DOC[doc_id] = (token, retriever)
+
+    # The builder has already pickled BM25 next to the Chroma collection
+    _RETRIEVER_INDEX[doc_id] = {
+        "fp": token,
+        "chroma_collection": doc_id,
+        "bm25_pkl_path": str(retriever_builder.bm25_cache_path(doc_id)),
+    }
+    try:
+        _save_retriever_index()
+    except Exception as e:
+        # The in-memory retriever is fine; a later cold start just rebuilds it
+        logger.error(f"Failed to persist retriever index for {doc_id}: {e}")
+    return retriever
 
-        files = [LocalFile(name=path)]
-        chunks = processor.process(files)  # your file_handler caching stays intact
 
-        for c in chunks:
-            c.metadata = c.metadata or {}
-            c.metadata.update({"doc_id": doc_id, "source": doc_id})
+def _dumps(obj: Any) -> str:
+    """SSE payloads are text; orjson returns UTF-8 bytes."""
+    return orjson.dumps(obj).decode()
 
-        # Keep your collection naming
-        retriever = retriever_builder.build_hybrid_retriever(chunks, collection_name=doc_id)
 
-        _RETRIEVER_BY_DOC[doc_id] = retriever
-        _DOC_FP[doc_id] = fp
-        return retriever
+@lru_cache(maxsize=64)
+def _agent_event_prefix(agent: str, status: str) -> str:
+    """'{"agent":...,"status":...' without the closing brace, built once per pair."""
+    return _dumps({"agent": agent, "status": status})[:-1]
+
+
+def _agent_event_data(agent: str, status: str, extra: Dict[str, Any]) -> str:
+    """SSE agent-event JSON; only the variable fields are serialized per event."""
+    prefix = _agent_event_prefix(agent, status)
+    if not extra:
+        return prefix + "}"
+    return prefix + "," + _dumps(extra)[1:]
+
+
+def _qa_key(question: str, doc_id: str, top_k_sources: int, max_source_chars: int) -> str:
+    """Answer-cache key; includes the file fingerprint so edits invalidate it."""
+    # Edits show up once the scan TTL expires; cache hits cost no syscalls
+    return qa_cache.make_key(question, doc_id, _fp_token(_current_fp(doc_id)), top_k_sources, max_source_chars)
+
+
+def _build_sources(docs: List[Document], top_k_sources: int, max_source_chars: int) -> List[Dict[str, Any]]:
+    """
+    Compact source payloads: drop near-duplicate chunks (same leading 256 chars),
+    keep only whitelisted metadata and truncate content (max_source_chars=0 keeps it all).
+    """
+    sources: List[Dict[str, Any]] = []
+    seen = set()
+    for d in docs:
+        if len(sources) >= top_k_sources:
+            break
+        content = d.page_content
+        digest = xxhash.xxh3_64_intdigest(content[:256].encode("utf-8", "ignore"))
+        if digest in seen:
+            continue
+        seen.add(digest)
+
+        # Document.metadata is always a dict, and every chunk gets doc_id/source at ingestion
+        metadata = d.metadata
+        sources.append({
+            "content": content[:max_source_chars] if max_source_chars > 0 else content,
+            "metadata": {k: metadata[k] for k in _SOURCE_METADATA_KEYS if k in metadata},
+        })
+    return sources
+
+
+def _to_response(
+    question: str, state: Dict[str, Any], top_k_sources: int, max_source_chars: int
+) -> AskResponse:
+    docs = state.get("documents") or []
+    # Built from our own typed data: skip re-validation (FastAPI still checks response_model)
+    sources = [
+        SourceItem.model_construct(**s) for s in _build_sources(docs, top_k_sources, max_source_chars)
+    ]
+
+    return AskResponse(
+        question=state.get("question", question),
+        is_relevant=state.get("is_relevant"),
+        draft_answer=state.get("draft_answer"),
+        verification_report=state.get("verification_report"),
+        sources=sources,
+    )
+
+
+def _record_ask(
+    endpoint: str, key: str, result: Dict[str, Any], doc_id: str, elapsed_ms: int
+) -> None:
+    """Post-response bookkeeping: persist the answer and log a one-line summary."""
+    qa_cache.set(key, result)
+    logger.info(
+        f"{endpoint} doc={doc_id} relevant={result.get('is_relevant')} "
+        f"sources={len(result.get('sources') or [])} in {elapsed_ms}ms"
+    )
+
+
+def _warm_one(doc_id: str) -> None:
+    t0 = time.perf_counter()
+    try:
+        _ensure_doc_retriever(doc_id)
+        logger.info(f"Warmed retriever for {doc_id} in {time.perf_counter() - t0:.1f}s")
+    except Exception as e:
+        logger.error(f"Failed to warm retriever for {doc_id}: {e}")
+
+
+async def _warm_retrievers() -> None:
+    """Build every built-in doc's retriever up front so first queries skip the build."""
+    # Bound concurrent builds so cold starts don't flood the embeddings API:
+    #   export WARMUP_PARALLEL=4
+    sem = asyncio.Semaphore(int(os.getenv("WARMUP_PARALLEL", "4")))
+
+    async def _bounded(doc_id: str) -> None:
+        async with sem:
+            await asyncio.to_thread(_warm_one, doc_id)
+
+    await asyncio.gather(*[_bounded(d) for d in _DOC_IDS])
 
 # ----------------------------
 # Routes
 # ----------------------------
 @app.get("/health")
 def health():
+    # In-memory only: never scan examples/ or stat files here, so frequent
+    # load-balancer / k8s probes cost no I/O
     return {
         "status": "ok",
         "uptime_sec": int(time.time() - _APP_START_TS),
         "docs_count": len(_DOC_IDS),
+        "ask_rejected": ask_limiter.rejected,
         "cors_origins": allow_origins,
     }
 
@@ -190,12 +588,20 @@ def health():
 @app.get("/api/docs")
 def list_docs():
     """Returns list of built-in PDFs (dropdown choices)."""
-    _load_builtin_docs()
+    global _EXAMPLES_DIR_MTIME
+
+    # Adding/removing/renaming a PDF bumps the directory mtime; in-place edits
+    # are picked up by the per-file fingerprint check when a retriever is used.
+    m = EXAMPLES_DIR.stat().st_mtime_ns
+    if m != _EXAMPLES_DIR_MTIME:
+        _load_builtin_docs(force=True)
+        _EXAMPLES_DIR_MTIME = m
     return {"docs": _DOC_IDS}
 
 
 @app.post("/api/ask", response_model=AskResponse)
-def ask(payload: AskRequest):
+async def ask(payload: AskRequest, background_tasks: BackgroundTasks):
+    t0 = time.perf_counter()
     question = (payload.question or "").strip()
     doc_id = (payload.doc_id or "").strip()
     top_k_sources = payload.top_k_sources
@@ -204,24 +610,51 @@ def ask(payload: AskRequest):
         raise HTTPException(status_code=400, detail="Missing 'question'")
 
     try:
-        retriever = _ensure_doc_retriever(doc_id)
-        state = workflow.full_pipeline(question=question, retriever=retriever)
-
-        docs = state.get("documents") or []
-        sources = [
-            SourceItem(
-                content=d.page_content,
-                metadata=getattr(d, "metadata", {}) or {},
-            )
-            for d in docs[:top_k_sources]
-        ]
-
-        return AskResponse(
-            question=state.get("question", question),
-            is_relevant=state.get("is_relevant"),
-            draft_answer=state.get("draft_answer"),
-            verification_report=state.get("verification_report"),
-            sources=sources,
+        doc_id = _validate_doc_id(doc_id)
+        key = _qa_key(question, doc_id, top_k_sources, payload.max_source_chars)
+        cached = qa_cache.get(key)
+        if cached is not None:
+            return AskResponse(**cached)
+
+        async with ask_limiter.slot("/api/ask"):
+            retriever = await _aget_doc_retriever(doc_id)
+            state = await workflow.afull_pipeline(question=question, retriever=retriever)
+
+        response = _to_response(question, state, top_k_sources, payload.max_source_chars)
+        # Cache write + logging run after the response has been sent
+        background_tasks.add_task(
+            _record_ask, "/api/ask", key, response.model_dump(), doc_id,
+            int((time.perf_counter() - t0) * 1000),
+        )
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/ask_batch", response_model=AskBatchResponse)
+async def ask_batch(payload: AskBatchRequest):
+    """
+    Answer several questions about the same built-in doc in one request.
+    Relevance labels are packed into shared LLM calls; drafts run concurrently.
+    """
+    questions = [q.strip() for q in payload.questions]
+    doc_id = (payload.doc_id or "").strip()
+
+    if not all(questions):
+        raise HTTPException(status_code=400, detail="Empty entry in 'questions'")
+
+    try:
+        async with ask_limiter.slot("/api/ask_batch"):
+            retriever = await _aget_doc_retriever(doc_id)
+            states = await workflow.abatch_pipeline(questions, retriever)
+        return AskBatchResponse(
+            results=[
+                _to_response(q, state, payload.top_k_sources, payload.max_source_chars)
+                for q, state in zip(questions, states)
+            ]
         )
 
     except HTTPException:
@@ -231,10 +664,10 @@ def ask(payload: AskRequest):
 
 
 @app.get("/api/ask/stream")
-async def ask_stream(question: str, doc_id: str, top_k_sources: int = 5):
+async def ask_stream(question: str, doc_id: str, top_k_sources: int = 5, max_source_chars: int = 500):
     """
     SSE endpoint for the Next.js "Agent Trace" UI.
-    GET /api/ask/stream?question=...&doc_id=<filename.pdf>&top_k_sources=5
+    GET /api/ask/stream?question=...&doc_id=<filename.pdf>&top_k_sources=5&max_source_chars=500
     """
     question = (question or "").strip()
     doc_id = (doc_id or "").strip()
@@ -243,27 +676,61 @@ async def ask_stream(question: str, doc_id: str, top_k_sources: int = 5):
         raise HTTPException(status_code=400, detail="Missing 'question'")
 
     async def emit(agent: str, status: str, **extra):
-        payload = {"agent": agent, "status": status, **extra}
-        return {"event": "agent", "data": json.dumps(payload)}
+        return {"event": "agent", "data": _agent_event_data(agent, status, extra)}
+
+    # Run once the stream has closed, like BackgroundTasks on a normal response
+    post_response = BackgroundTasks()
+
+    def record(key: str, final: Dict[str, Any], t0: float) -> None:
+        post_response.add_task(
+            _record_ask, "/api/ask/stream", key, final, doc_id,
+            int((time.perf_counter() - t0) * 1000),
+        )
+
+    t0 = time.perf_counter()
+    try:
+        key = _qa_key(question, _validate_doc_id(doc_id), top_k_sources, max_source_chars)
+    except HTTPException as e:
+        key, cached, key_error = None, None, str(e.detail)
+    else:
+        cached, key_error = qa_cache.get(key), None
+
+    # Take the slot before the stream opens so a saturated server answers a plain
+    # 503; cache hits and bad doc_ids never touch the pipeline and need none
+    release_slot = None
+    if key is not None and cached is None:
+        release_slot = await ask_limiter.acquire("/api/ask/stream")
 
     async def event_gen():
-        t0 = time.perf_counter()
+        if key_error is not None:
+            yield await emit("retrieval", "error", summary=key_error)
+            return
+
+        # Answer cache: replay a finished trace without touching the pipeline
+        if cached is not None:
+            for agent in ("relevance", "retrieval", "research", "verify"):
+                yield await emit(agent, "done", summary="Served from cache", ms=0)
+            yield {"event": "final", "data": _dumps(cached)}
+            return
 
-        # 1) relevance (placeholder event)
+        try:
+            async for event in pipeline_events():
+                yield event
+        finally:
+            # Also runs when the client disconnects and the generator is closed
+            release_slot()
+
+    async def pipeline_events():
+        # 1) relevance (resolved once documents are retrieved)
         yield await emit("relevance", "running")
-        await asyncio.sleep(0.05)
-        yield await emit(
-            "relevance",
-            "done",
-            summary="Relevance check complete",
-            ms=int((time.perf_counter() - t0) * 1000),
-        )
+        # Start the (possibly cold) retriever build right away; await it only when needed
+        t_retr = time.perf_counter()
+        retrieval_task = asyncio.create_task(_aget_doc_retriever(doc_id))
 
         # 2) retrieval
         yield await emit("retrieval", "running")
-        t_retr = time.perf_counter()
         try:
-            retriever = await asyncio.to_thread(_ensure_doc_retriever, doc_id)
+            retriever = await retrieval_task
         except Exception as e:
             yield await emit("retrieval", "error", summary=str(e))
             return
@@ -275,26 +742,49 @@ async def ask_stream(question: str, doc_id: str, top_k_sources: int = 5):
             ms=int((time.perf_counter() - t_retr) * 1000),
         )
 
-        # 3) research + 4) verify
-        yield await emit("research", "running")
-        yield await emit("verify", "running")
+        try:
+            docs, relevance = await workflow.aretrieve_and_check(question, retriever)
+        except Exception as e:
+            yield await emit("relevance", "error", summary=str(e))
+            return
 
+        yield await emit(
+            "relevance",
+            "done",
+            summary="Relevance check complete",
+            ms=int((time.perf_counter() - t0) * 1000),
+        )
+
+        sources = _build_sources(docs, top_k_sources, max_source_chars)
+
+        if not relevance["is_relevant"]:
+            final = {
+                "question": question,
+                "draft_answer": relevance["draft_answer"],
+                "verification_report": None,
+                "is_relevant": False,
+                "sources": sources,
+            }
+            record(key, final, t0)
+            yield {"event": "final", "data": _dumps(final)}
+            return
+
+        # 3) research: forward tokens as they are generated
+        yield await emit("research", "running")
         t_pipe = time.perf_counter()
+        parts: List[str] = []
         try:
-            state = await asyncio.to_thread(workflow.full_pipeline, question, retriever)
+            async for tok in workflow.researcher.agenerate_stream(question, docs):
+                parts.append(tok)
+                yield {"event": "token", "data": _dumps({"t": tok})}
         except Exception as e:
             yield await emit("research", "error", summary="Pipeline failed")
-            yield {"event": "final", "data": json.dumps({"error": str(e)})}
+            yield {"event": "final", "data": _dumps({"error": str(e)})}
             return
 
-        docs = state.get("documents") or []
-        sources = [
-            {"content": d.page_content, "metadata": getattr(d, "metadata", {}) or {}}
-            for d in docs[:top_k_sources]
-        ]
-
-        draft = state.get("draft_answer")
-        verification = state.get("verification_report")
+        draft = workflow.researcher.sanitize_response("".join(parts)) or (
+            "I cannot answer this question based on the provided documents."
+        )
 
         yield await emit(
             "research",
@@ -304,28 +794,37 @@ async def ask_stream(question: str, doc_id: str, top_k_sources: int = 5):
             preview=(draft[:220] + "…") if isinstance(draft, str) and len(draft) > 220 else draft,
         )
 
+        # 4) verify (single pass: the draft has already been streamed)
+        yield await emit("verify", "running")
+        t_verify = time.perf_counter()
+        try:
+            verification = (await workflow.verifier.acheck(draft, docs))["verification_report"]
+        except Exception as e:
+            yield await emit("verify", "error", summary="Verification failed")
+            yield {"event": "final", "data": _dumps({"error": str(e)})}
+            return
+
         yield await emit(
             "verify",
             "done",
             summary="Verification complete",
-            ms=int((time.perf_counter() - t_pipe) * 1000),
+            ms=int((time.perf_counter() - t_verify) * 1000),
         )
 
-        yield {
-            "event": "final",
-            "data": json.dumps(
-                {
-                    "question": state.get("question", question),
-                    "draft_answer": draft,
-                    "verification_report": verification,
-                    "is_relevant": state.get("is_relevant"),
-                    "sources": sources,
-                }
-            ),
+        final = {
+            "question": question,
+            "draft_answer": draft,
+            "verification_report": verification,
+            "is_relevant": True,
+            "sources": sources,
         }
+        record(key, final, t0)
+
+        yield {"event": "final", "data": _dumps(final)}
 
     return EventSourceResponse(
         event_gen(),
+        background=post_response,
         headers={
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no",
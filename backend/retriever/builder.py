@@ -1,20 +1,227 @@
+import asyncio
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import bm25s
+import chromadb
+import xxhash
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.retrievers import BM25Retriever
 from langchain_classic.retrievers import EnsembleRetriever
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage import LocalFileStore
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import patch_config
+from langchain_core.vectorstores import VectorStore
 from config.settings import settings
 from llm.openai_llm import OPENAI_API_KEY
+from typing import Any, Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Metadata key under which the vector leg reports each hit's cosine similarity
+VECTOR_SIMILARITY_KEY = "vector_similarity"
+
+
+class BM25sRetriever(BaseRetriever):
+    """
+    Keyword retriever backed by bm25s (sparse-matrix BM25 scored in numpy),
+    a drop-in for LangChain's pure-Python BM25Retriever.
+    """
+    docs: List[Document]
+    index: Any    # bm25s.BM25
+    k: int = 4    # same default as BM25Retriever
+
+    @classmethod
+    def from_documents(cls, docs: List[Document], **kwargs) -> "BM25sRetriever":
+        tokens = bm25s.tokenize(
+            [d.page_content for d in docs], stopwords="en", show_progress=False
+        )
+        index = bm25s.BM25()
+        index.index(tokens, show_progress=False)
+        return cls(docs=docs, index=index, **kwargs)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Plain tokens (not ids) so they are looked up in the corpus vocabulary
+        query_tokens = bm25s.tokenize(
+            query, stopwords="en", return_ids=False, show_progress=False
+        )
+        k = min(self.k, len(self.docs))
+        if not query_tokens[0] or k == 0:
+            return []
+
+        idx, scores = self.index.retrieve(query_tokens, k=k, show_progress=False)
+        return [self.docs[i] for i, s in zip(idx[0], scores[0]) if s > 0]
+
+
+class ScoredVectorRetriever(BaseRetriever):
+    """
+    Vector leg of the hybrid retriever: the same search as
+    vectorstore.as_retriever(), but every hit carries its cosine similarity in
+    metadata[VECTOR_SIMILARITY_KEY], so the relevance gate reads the scores of
+    this search instead of running a second one.
+    """
+    vectorstore: VectorStore
+    k: int = 4
+
+    @staticmethod
+    def _with_similarity(hits) -> List[Document]:
+        # Chroma's default space is squared L2; OpenAI embeddings are unit
+        # length, so cosine similarity = 1 - d / 2
+        for doc, distance in hits:
+            doc.metadata = {**(doc.metadata or {}), VECTOR_SIMILARITY_KEY: 1.0 - distance / 2}
+        return [doc for doc, _ in hits]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._with_similarity(self.vectorstore.similarity_search_with_score(query, k=self.k))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._with_similarity(
+            await self.vectorstore.asimilarity_search_with_score(query, k=self.k)
+        )
+
+
+# Child retrievers of a sync query run here concurrently (vector search is mostly
+# waiting on the embeddings API); shared so queries don't each spawn threads
+_FUSION_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fusion")
+
+
+class HybridRetriever(EnsembleRetriever):
+    """
+    EnsembleRetriever that keeps a handle on its vector store.
+     - Sync queries run BM25 and the vector search in parallel, not one after the other
+     - Weighted reciprocal-rank fusion (c=60) is a single pass that also dedupes,
+       and only the top `top_k` fused documents are returned
+     - A document found by both legs keeps the vector leg's copy, which carries
+       its similarity score (see ScoredVectorRetriever)
+    """
+    vectorstore: Optional[VectorStore] = None
+    top_k: Optional[int] = None
+
+    def rank_fusion(
+        self,
+        query: str,
+        run_manager: CallbackManagerForRetrieverRun,
+        *,
+        config: Optional[RunnableConfig] = None,
+    ) -> List[Document]:
+        futures = [
+            _FUSION_POOL.submit(
+                retriever.invoke,
+                query,
+                patch_config(config, callbacks=run_manager.get_child(tag=f"retriever_{i + 1}")),
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+        return self.weighted_reciprocal_rank([f.result() for f in futures])
+
+    def weighted_reciprocal_rank(self, doc_lists: List[List[Document]]) -> List[Document]:
+        if len(doc_lists) != len(self.weights):
+            raise ValueError("Number of rank lists must be equal to the number of weights.")
+
+        scores: Dict[str, float] = {}
+        first_seen: Dict[str, Document] = {}
+        for doc_list, weight in zip(doc_lists, self.weights):
+            for rank, doc in enumerate(doc_list, start=1):
+                key = doc.page_content if self.id_key is None else doc.metadata[self.id_key]
+                scores[key] = scores.get(key, 0.0) + weight / (rank + self.c)
+                if key not in first_seen or VECTOR_SIMILARITY_KEY in doc.metadata:
+                    first_seen[key] = doc   # same position, scored copy preferred
+
+        # sorted() is stable: ties keep first-seen order, as in EnsembleRetriever
+        ranked = sorted(first_seen, key=scores.__getitem__, reverse=True)
+        if self.top_k is not None:
+            ranked = ranked[: self.top_k]
+        return [first_seen[key] for key in ranked]
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Splits large embed_documents() calls into tiles of `batch_size` texts and
+    sends the tiles concurrently, instead of one request after another.
+    The sync path uses threads, never a private event loop: the async OpenAI
+    client's pooled connections are bound to the loop that first used them.
+    """
+
+    def __init__(self, underlying: Embeddings, batch_size: int, max_concurrency: int):
+        self.underlying = underlying
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    def _tiles(self, texts: List[str]) -> List[List[str]]:
+        size = min(self.batch_size, len(texts)) or 1
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        tiles = self._tiles(texts)
+        if len(tiles) <= 1:
+            return self.underlying.embed_documents(texts)
+
+        # The sync client is thread-safe; map() keeps the tiles in order
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, len(tiles)),
+            thread_name_prefix="embed",
+        ) as pool:
+            results = list(pool.map(self.underlying.embed_documents, tiles))
+        return [vec for tile in results for vec in tile]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(tile: List[str]) -> List[List[float]]:
+            async with sem:
+                return await self.underlying.aembed_documents(tile)
+
+        results = await asyncio.gather(*[_one(t) for t in self._tiles(texts)])
+        return [vec for tile in results for vec in tile]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+
 class RetrieverBuilder:
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
+        model = "text-embedding-3-large"
+        openai_embeddings = OpenAIEmbeddings(
             api_key=OPENAI_API_KEY,
-            model="text-embedding-3-large",
+            model=model,
+            chunk_size=settings.EMBED_BATCH_SIZE,
+            max_retries=6,
         )
 
+        # Cache vectors by chunk text, so re-indexing an edited PDF only
+        # embeds the chunks that actually changed
+        self.embeddings = CacheBackedEmbeddings.from_bytes_store(
+            BatchedEmbeddings(
+                openai_embeddings,
+                batch_size=settings.EMBED_BATCH_SIZE,
+                max_concurrency=settings.EMBED_MAX_CONCURRENCY,
+            ),
+            LocalFileStore(str(Path(settings.CACHE_DIR) / "embeddings")),
+            namespace=model,
+            key_encoder="blake2b",
+        )
+
+        # One Chroma client (and sqlite connection) shared by every collection
+        self._client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+
     def build_hybrid_retriever(self, docs, *, collection_name: str | None = None):
         """
         Build a hybrid retriever using BM25 and vector-based retrieval.
@@ -23,30 +230,139 @@ class RetrieverBuilder:
         """
         try:
             collection = collection_name or "default"
+            if not docs:
+                # e.g. Docling failed: never let an empty rebuild wipe the persisted collection
+                raise ValueError(f"No chunks to index for collection '{collection}'")
 
-            vector_store = Chroma.from_documents(
-                documents=docs,
-                embedding=self.embeddings,
-                persist_directory=settings.CHROMA_DB_PATH,
+            vector_store = Chroma(
+                client=self._client,
                 collection_name=collection,
+                embedding_function=self.embeddings,
             )
+            self._index_documents(vector_store, docs, collection)
             logger.info(f"Vector store ready (collection='{collection}').")
 
-            bm25 = BM25Retriever.from_documents(docs)
-            logger.info("BM25 retriever created successfully.")
+            bm25 = self._get_bm25(docs, collection)
 
-            vector_retriever = vector_store.as_retriever(
-                search_kwargs={"k": settings.VECTOR_SEARCH_K}
-            )
-            logger.info("Vector retriever created successfully.")
-
-            hybrid_retriever = EnsembleRetriever(
-                retrievers=[bm25, vector_retriever],
-                weights=settings.HYBRID_RETRIEVER_WEIGHTS,
-            )
-            logger.info("Hybrid retriever created successfully.")
-            return hybrid_retriever
+            return self._combine(bm25, vector_store)
 
         except Exception as e:
             logger.error(f"Failed to build hybrid retriever: {e}")
             raise
+
+    def _index_documents(self, vector_store: Chroma, docs, collection: str) -> None:
+        """
+        Embed and write chunks group by group with pre-computed vectors.
+        Each group is EMBED_MAX_CONCURRENCY request tiles, embedded concurrently,
+        so only one group's vectors are held at a time. Ids are deterministic
+        ("<collection>-<n>") and written with upsert: rebuilding a doc replaces
+        its chunks instead of appending duplicates, and leftovers are deleted.
+        """
+        group = settings.EMBED_BATCH_SIZE * settings.EMBED_MAX_CONCURRENCY
+        ids = [f"{collection}-{n}" for n in range(len(docs))]
+
+        for i in range(0, len(docs), group):
+            sub = docs[i:i + group]
+            texts = [d.page_content for d in sub]
+            vectors = self.embeddings.embed_documents(texts)
+            vector_store._collection.upsert(
+                ids=ids[i:i + group],
+                embeddings=vectors,
+                documents=texts,
+                metadatas=[d.metadata or None for d in sub],
+            )
+
+        stale = set(vector_store._collection.get(include=[])["ids"]) - set(ids)
+        if stale:
+            vector_store._collection.delete(ids=list(stale))
+            logger.info(f"Removed {len(stale)} stale chunks from '{collection}'.")
+
+    def bm25_cache_path(self, collection: str) -> Path:
+        """Pickled BM25 index for a collection, stored next to the Chroma data."""
+        return Path(settings.CHROMA_DB_PATH) / f"{collection}.bm25.pkl"
+
+    @staticmethod
+    def _chunks_digest(docs) -> str:
+        """Content key for the BM25 cache: changes iff any chunk text/metadata does."""
+        h = xxhash.xxh3_128(b"bm25s")   # salted by index type, so old pickles are refit
+        for d in docs:
+            h.update(d.page_content.encode("utf-8", "ignore"))
+            h.update(b"\0")
+            h.update(repr(sorted((d.metadata or {}).items())).encode("utf-8", "ignore"))
+            h.update(b"\1")
+        return h.hexdigest()
+
+    def _get_bm25(self, docs, collection: str) -> BM25sRetriever:
+        """
+        Reuse the pickled BM25 index when its `.fp` sidecar matches the chunks,
+        otherwise fit it and persist it for next time.
+        """
+        path = self.bm25_cache_path(collection)
+        fp_path = path.with_suffix(".fp")
+        digest = self._chunks_digest(docs)
+
+        try:
+            if fp_path.read_text() == digest:
+                with open(path, "rb") as f:
+                    bm25 = pickle.load(f)
+                logger.info("BM25 retriever loaded from cache.")
+                return bm25
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable BM25 cache for '{collection}': {e}")
+
+        bm25 = BM25sRetriever.from_documents(docs)
+        logger.info("BM25 retriever created successfully.")
+
+        try:
+            # Drop the sidecar first so a half-finished save never looks valid
+            fp_path.unlink(missing_ok=True)
+            self._save_bm25(bm25, str(path))
+            fp_path.write_text(digest)
+        except Exception as e:
+            logger.error(f"Failed to cache BM25 retriever for '{collection}': {e}")
+        return bm25
+
+    def load_hybrid_retriever(self, collection_name: str, bm25_pkl_path: str) -> HybridRetriever:
+        """
+        Reopen a previously built hybrid retriever: the persisted Chroma collection
+        plus the pickled BM25 index. Nothing is parsed or embedded.
+        """
+        vector_store = Chroma(
+            client=self._client,
+            collection_name=collection_name,
+            embedding_function=self.embeddings,
+        )
+        if vector_store._collection.count() == 0:
+            raise ValueError(f"Chroma collection '{collection_name}' is empty")
+
+        with open(bm25_pkl_path, "rb") as f:
+            bm25 = pickle.load(f)
+        logger.info(f"Loaded persisted retriever (collection='{collection_name}').")
+
+        return self._combine(bm25, vector_store)
+
+    @staticmethod
+    def _save_bm25(bm25: BM25sRetriever, bm25_pkl_path: str) -> None:
+        """Pickle a BM25 retriever (atomic: tmp file + os.replace)."""
+        Path(bm25_pkl_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{bm25_pkl_path}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(bm25, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, bm25_pkl_path)
+
+    def _combine(self, bm25: BaseRetriever, vector_store: Chroma) -> HybridRetriever:
+        vector_retriever = ScoredVectorRetriever(
+            vectorstore=vector_store, k=settings.VECTOR_SEARCH_K
+        )
+        logger.info("Vector retriever created successfully.")
+
+        hybrid_retriever = HybridRetriever(
+            retrievers=[bm25, vector_retriever],
+            weights=settings.HYBRID_RETRIEVER_WEIGHTS,
+            vectorstore=vector_store,
+            top_k=settings.VECTOR_SEARCH_K,
+        )
+        logger.info("Hybrid retriever created successfully.")
+        return hybrid_retriever
@@ -0,0 +1,102 @@
+"""
+/api/ask_batch must never turn a model failure into the canned "isn't related" answer.
+Run from backend/:  python -m pytest -q tests
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.retrievers import BaseRetriever
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("WARMUP_ON_START", "0")
+
+import main  # noqa: E402
+
+NOT_RELATED = "isn't related"
+
+
+class FakeRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="The answer is 42.", metadata={"doc_id": "x"})]
+
+
+class FakeModel:
+    """Stands in for ChatOpenAI: `reply` maps a prompt to content, or raises."""
+
+    def __init__(self, reply, max_tokens=10):
+        self.reply = reply
+        self.max_tokens = max_tokens
+
+    async def ainvoke(self, messages, **kwargs):
+        return AIMessage(content=self.reply(messages[0].content))
+
+    def invoke(self, messages, **kwargs):
+        return AIMessage(content=self.reply(messages[0].content))
+
+
+def _answer(prompt):
+    if "verif" in prompt.lower():
+        return "Supported: YES\nRelevant: YES"
+    return "It is 42."
+
+
+def _raise(prompt):
+    raise TimeoutError("429 Too Many Requests")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_retriever(doc_id):
+        return FakeRetriever()
+
+    monkeypatch.setattr(main, "_aget_doc_retriever", fake_retriever)
+    wf = main.workflow
+    monkeypatch.setattr(wf.researcher, "model", FakeModel(_answer, 80))
+    monkeypatch.setattr(wf.verifier, "model", FakeModel(_answer, 40))
+    with TestClient(main.app) as c:
+        yield c
+
+
+def _ask_batch(client):
+    return client.post(
+        "/api/ask_batch",
+        json={"questions": ["What is the answer?", "And again?"], "doc_id": "any.pdf"},
+    )
+
+
+def test_batch_model_error_is_not_reported_as_unrelated(client, monkeypatch):
+    rc = main.workflow.relevance_checker
+    monkeypatch.setattr(rc, "joint_model", FakeModel(_raise, 120))
+    monkeypatch.setattr(rc, "model", FakeModel(_raise, 1))
+
+    r = _ask_batch(client)
+
+    assert r.status_code != 200
+    assert NOT_RELATED not in r.text
+
+
+def test_batch_short_json_falls_back_to_per_item_check(client, monkeypatch):
+    rc = main.workflow.relevance_checker
+    # Only the first item comes back; the second must be re-checked, not guessed
+    monkeypatch.setattr(
+        rc, "joint_model", FakeModel(lambda p: '{"labels": [{"id": 1, "label": "CAN_ANSWER"}', 120)
+    )
+    monkeypatch.setattr(rc, "model", FakeModel(lambda p: "CAN", 1))
+
+    r = _ask_batch(client)
+
+    assert r.status_code == 200
+    assert NOT_RELATED not in r.text
+    assert all(item["is_relevant"] for item in r.json()["results"])
+
+
+def test_batch_rejects_overlong_question(client):
+    r = client.post("/api/ask_batch", json={"questions": ["x" * 4001], "doc_id": "any.pdf"})
+
+    assert r.status_code == 422
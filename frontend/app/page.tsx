@@ -112,6 +112,8 @@ export default function Page() {
   }));
 
   const [finalResult, setFinalResult] = useState<FinalPayload | null>(null);
+  // Draft text streamed token-by-token before the final payload arrives
+  const [liveDraft, setLiveDraft] = useState<string>("");
   const [errorMsg, setErrorMsg] = useState<string>("");
   const [isStreaming, setIsStreaming] = useState<boolean>(false);
 
@@ -148,6 +150,7 @@ export default function Page() {
   function resetRun() {
     setErrorMsg("");
     setFinalResult(null);
+    setLiveDraft("");
     setEvents({
       relevance: { agent: "relevance", status: "idle" },
       retrieval: { agent: "retrieval", status: "idle" },
@@ -225,6 +228,11 @@ export default function Page() {
       }));
     });
 
+    es.addEventListener("token", (evt: MessageEvent) => {
+      const data = safeJsonParse(evt.data);
+      if (typeof data?.t === "string") setLiveDraft((prev) => prev + data.t);
+    });
+
     es.addEventListener("final", (evt: MessageEvent) => {
       const data = safeJsonParse(evt.data) as FinalPayload | null;
       if (data?.error) {
@@ -472,7 +480,7 @@ export default function Page() {
                 </div>
 
                 <pre className="mt-2 whitespace-pre-wrap text-sm text-[rgb(var(--fg)/0.9)]">
-                  {finalResult?.draft_answer || (isStreaming ? "Working..." : "No answer yet.")}
+                  {finalResult?.draft_answer || liveDraft || (isStreaming ? "Working..." : "No answer yet.")}
                 </pre>
               </div>
 